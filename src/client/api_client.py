@@ -3,21 +3,61 @@
 import requests
 from retrying import retry
 import logging
-from typing import Dict, Any
+import threading
+import time
+from collections import deque
+from typing import Dict, Any, List, Optional
 
 logger = logging.getLogger("FileMonitor.APIClient")
 
 class APIClient:
-    def __init__(self, endpoint: str, api_key: str, max_retries: int = 3):
+    def __init__(self, endpoint: str, api_key: str, max_retries: int = 3,
+                 batch_size: int = 100, flush_interval: float = 1.0,
+                 max_queue_size: int = 10000, max_flush_interval: float = 60.0,
+                 enricher=None, sequence=None, spool=None, stream=None):
         """
         初始参数
         :param endpoint:对应路由
         :param api_key:认证key
         :param max_retries:最大重复次数
+        :param batch_size:单批最大事件数（会根据服务端预算自适应缩小）
+        :param flush_interval:基础发送间隔（秒，会根据服务端预算自适应放大）
+        :param max_queue_size:本地缓冲队列上限，超过后丢弃最旧事件
+        :param max_flush_interval:发送间隔上限（秒）
+        :param enricher:元数据补充（MetadataEnricher），发送前为每批事件补充 meta
+        :param sequence:事件序号（SequenceCounter），为每个事件分配持久化的递增序号
+        :param spool:未确认事件的持久化缓存（EventSpool），重启后重新上报，服务端报告缺口时从中补发
+        :param stream:长连接（StreamConnection），可用时批量事件走长连接，否则走 HTTP
         """
         self.endpoint = endpoint
+        self.batch_endpoint = f"{endpoint.rstrip('/')}/batch"
         self.headers = {"X-API-Key": api_key}#请求头 存放认证钥匙
         self.max_retries = max_retries
+        self.enricher = enricher
+        self.sequence = sequence
+        self.spool = spool if sequence is not None else None
+        self._resending = set()  # 已重新排队、等待确认的序号（避免重复补发）
+        self._seq_lock = threading.Lock()  # 分配序号与写入缓存保持原子
+        self._abandoned: List[List[int]] = []  # 待告知服务端的无法补发的序号区间
+        self.stream = stream
+        if stream is not None:
+            stream.on_flow = self._on_flow
+
+        # 批量发送（start() 后启用）
+        self.max_batch_size = batch_size
+        self.base_flush_interval = flush_interval
+        self.max_flush_interval = max_flush_interval
+        self.batch_size = batch_size          # 当前批量大小
+        self.flush_interval = flush_interval  # 当前发送间隔
+        self._queue: deque = deque(maxlen=max_queue_size)
+        self._queue_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.is_running = False
+
+        # 时钟偏差估计（服务端时间 - 本机时间），取最近几次往返中 RTT 最小的样本
+        self.clock_offset: Optional[float] = None
+        self._clock_samples: deque = deque(maxlen=8)
 
     def _should_retry(self, exception) -> bool:
         """决定是否重试"""
@@ -31,7 +71,9 @@ class APIClient:
         :param event_data:#传输数据
         :return:
         """
+        self._assign_seq(event_data)
         try:
+            sent, sent_wall = self._stamp_sent([event_data])
             response = requests.post(
                 self.endpoint,      #对应路由
                 json=event_data,    #传输数据
@@ -39,6 +81,8 @@ class APIClient:
                 timeout=5
             )
             response.raise_for_status()
+            self._update_clock_offset(response, sent, sent_wall)
+            self._after_ack([event_data], response.json())
             return True
         except requests.RequestException as e:
             logger.error(f"上报失败: {str(e)}")
@@ -47,12 +91,277 @@ class APIClient:
     def safe_report(self, event_data: Dict[str, Any]):
         """
         安全上报（捕获所有异常，避免影响主程序） 调用report_event函数
+        批量模式启动后只入队，由后台线程按批发送
         :param event_data:#传输数据
         :return:
         """
         """"""
+        if self.is_running:
+            self._enqueue(event_data)
+            return True
         try:
             return self.report_event(event_data)
         except Exception as e:
             logger.error(f"事件上报最终失败: {event_data}")
-            return False
\ No newline at end of file
+            return False
+
+    # ---------------------- 序号与补发 ----------------------
+    def _assign_seq(self, event_data: Dict[str, Any]) -> None:
+        """分配事件序号并写入持久化缓存（重新排队的事件保留原序号）"""
+        if self.sequence is None or "seq" in event_data:
+            return
+        with self._seq_lock:
+            event_data["seq"] = self.sequence.next()
+            event_data["seq_epoch"] = self.sequence.epoch
+            evicted = self.spool.add(event_data) if self.spool is not None else []
+        self._abandon(_to_ranges(evicted))
+
+    def _abandon(self, ranges: List[List[int]]) -> None:
+        """记录无法补发的序号区间，随下一批事件告知服务端"""
+        if ranges:
+            with self._queue_lock:
+                self._abandoned.extend(ranges)
+
+    def _recover(self) -> None:
+        """启动时重新上报上次未确认的事件（放在队首，保持序号顺序）"""
+        if self.spool is None:
+            return
+        # 异常退出时预留但未分配给事件的序号永远不会出现
+        high, next_seq = self.spool.high_water, self.sequence.peek()
+        if next_seq - 1 > high:
+            self._abandon([[high + 1, next_seq - 1]])
+        pending = self.spool.pending()
+        for event in pending:
+            event.pop("trace", None)  # 上一个进程的单调时钟时间戳已无意义
+        if pending:
+            self._resending.update(event["seq"] for event in pending)
+            self._requeue(pending)
+        for event in self.spool.take_orphans():
+            event.pop("trace", None)
+            self._enqueue(event)  # 序号状态已重建的旧事件重新编号
+
+    def _after_ack(self, events: List[Dict[str, Any]], body: Dict[str, Any]) -> None:
+        """服务端确认后：从缓存中删除已确认事件，并补发服务端报告缺失的序号"""
+        if self.spool is None:
+            return
+        seqs = [event["seq"] for event in events if "seq" in event]
+        self.spool.ack(seqs)
+        self._resending.difference_update(seqs)
+        missing = body.get("missing") or []
+        if missing:
+            self._resend(missing)
+
+    def _resend(self, ranges: List[List[int]]) -> None:
+        """从缓存补发缺失区间内的事件（已在补发中的跳过）"""
+        resend = []
+        for start, end in ranges:
+            found, absent = self.spool.lookup(start, end)
+            resend.extend(event for event in found if event["seq"] not in self._resending)
+            # 不在缓存中的序号（已被丢弃或从未分配）无法补发，告知服务端不再报告
+            self._abandon(absent)
+        if resend:
+            logger.warning(f"服务端报告序号缺口，补发 {len(resend)} 条事件")
+            self._resending.update(event["seq"] for event in resend)
+            self._requeue(resend)
+
+    # ---------------------- 延迟追踪 ----------------------
+    def _stamp_sent(self, events: List[Dict[str, Any]]):
+        """
+        在事件 trace 中记录发送时刻（单调时钟 + 墙上时间锚点）和当前时钟偏差估计
+        :return: (发送时单调时钟, 发送时墙上时间)
+        """
+        sent, sent_wall = time.monotonic(), time.time()
+        for event in events:
+            trace = event.get("trace")
+            if trace is not None:
+                trace.setdefault("enqueued", trace.get("observed", sent))
+                trace.update(sent=sent, sent_wall=sent_wall, clock_offset=self.clock_offset)
+        return sent, sent_wall
+
+    def _update_clock_offset(self, response, sent: float, sent_wall: float) -> None:
+        """根据响应中的 server_time 估计时钟偏差（假设往返路径对称）"""
+        try:
+            server_time = response.json().get("server_time")
+        except ValueError:
+            return
+        self._record_clock_sample(server_time, sent, sent_wall)
+
+    def _record_clock_sample(self, server_time: Optional[float], sent: float, sent_wall: float) -> None:
+        if server_time is None:
+            return
+        rtt = time.monotonic() - sent
+        self._clock_samples.append((rtt, server_time - (sent_wall + rtt / 2)))
+        self.clock_offset = min(self._clock_samples)[1]
+
+    # ---------------------- 批量发送 ----------------------
+    def _enqueue(self, event_data: Dict[str, Any]) -> None:
+        """事件入队，队列攒够一批且未被限流时提前唤醒发送线程"""
+        trace = event_data.get("trace")
+        if trace is not None:
+            trace["enqueued"] = time.monotonic()
+        self._assign_seq(event_data)
+        with self._queue_lock:
+            if len(self._queue) == self._queue.maxlen:
+                logger.warning(f"本地缓冲已满，丢弃最旧事件: {self._queue[0].get('path')}")
+            self._queue.append(event_data)
+            ready = len(self._queue) >= self.batch_size
+        if ready and self.flush_interval <= self.base_flush_interval:
+            self._wakeup.set()
+
+    def _take_batch(self) -> List[Dict[str, Any]]:
+        with self._queue_lock:
+            n = min(self.batch_size, len(self._queue))
+            return [self._queue.popleft() for _ in range(n)]
+
+    def _requeue(self, events: List[Dict[str, Any]]) -> None:
+        """未被接收的事件放回队首，保持顺序"""
+        with self._queue_lock:
+            self._queue.extendleft(reversed(events))
+
+    def _adapt(self, budget: Dict[str, Any]) -> None:
+        """
+        根据服务端返回的预算调整批量大小和发送间隔
+        budget: {"limit", "remaining", "refill_per_sec", "retry_after"}
+        """
+        remaining = budget.get("remaining", self.max_batch_size)
+        rate = budget.get("refill_per_sec") or 0
+        retry_after = budget.get("retry_after", 0)
+
+        if retry_after > 0 or remaining < 1:
+            # 令牌耗尽：等到令牌回补再发，批量按补充速率攒
+            interval = max(self.base_flush_interval, retry_after)
+            self.flush_interval = min(self.max_flush_interval, interval)
+            self.batch_size = max(1, min(self.max_batch_size, int(rate * self.flush_interval)))
+        elif remaining < self.max_batch_size:
+            # 预算偏紧：批量不超过剩余令牌，间隔保证一批的令牌能补回来
+            self.batch_size = max(1, remaining)
+            interval = self.batch_size / rate if rate else self.base_flush_interval
+            self.flush_interval = min(self.max_flush_interval, max(self.base_flush_interval, interval))
+        else:
+            # 预算充足：恢复默认值
+            self.batch_size = self.max_batch_size
+            self.flush_interval = self.base_flush_interval
+
+    def _on_flow(self, message: Dict[str, Any]) -> None:
+        """长连接流控：暂停时按预算退避，恢复时立即发送积压事件"""
+        self._adapt(message.get("rate_limit", {}))
+        if message.get("action") == "resume":
+            logger.info("服务端通知恢复发送")
+            self._wakeup.set()
+
+    def _send_stream(self, payload: Dict[str, Any], sent: float, sent_wall: float) -> Optional[Dict[str, Any]]:
+        """通过长连接发送一批事件，长连接不可用时返回 None（由调用方改用 HTTP）"""
+        if self.stream is None or not self.stream.ensure_connected():
+            return None
+        body = self.stream.send_events(payload)
+        if body is not None:
+            self._record_clock_sample(body.get("server_time"), sent, sent_wall)
+        return body
+
+    def flush(self) -> int:
+        """
+        发送一批事件
+        :return: 服务端接收的事件数
+        """
+        events = self._take_batch()
+        if not events:
+            return 0
+        if self.enricher is not None:
+            try:
+                self.enricher.enrich(events)
+            except Exception:
+                logger.error("元数据补充失败，按原始事件上报", exc_info=True)
+        payload = {"host": events[0].get("host"), "events": events}
+        with self._queue_lock:
+            abandoned = list(self._abandoned)
+        if abandoned:
+            payload.update(seq_epoch=self.sequence.epoch, abandoned=abandoned)
+        sent, sent_wall = self._stamp_sent(events)
+        body = self._send_stream(payload, sent, sent_wall)
+        if body is None:
+            try:
+                response = requests.post(
+                    self.batch_endpoint,
+                    json=payload,
+                    headers=self.headers,
+                    timeout=5
+                )
+                self._update_clock_offset(response, sent, sent_wall)
+                if response.status_code != 429:
+                    response.raise_for_status()
+                body = response.json()
+            except (requests.RequestException, ValueError) as e:
+                # 网络异常：放回队列，发送间隔指数退避
+                self._requeue(events)
+                self.flush_interval = min(self.max_flush_interval, self.flush_interval * 2)
+                logger.error(f"批量上报失败: {str(e)}，{self.flush_interval:.1f} 秒后重试")
+                return 0
+
+        if abandoned:
+            # 服务端已处理（限流时也会先处理）
+            with self._queue_lock:
+                del self._abandoned[:len(abandoned)]
+
+        if body.get("status") == "rate_limited":
+            self._requeue(events)
+            self._adapt(body.get("rate_limit", {}))
+            logger.warning(f"服务端限流，{self.flush_interval:.1f} 秒后重试，批量调整为 {self.batch_size}")
+            return 0
+
+        accepted = body.get("accepted", len(events))
+        if accepted < len(events):
+            self._requeue(events[accepted:])
+        self._adapt(body.get("rate_limit", {}))
+        self._after_ack(events[:accepted], body)
+        return accepted
+
+    def _flush_loop(self):
+        """后台发送线程"""
+        while self.is_running:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.error("批量发送线程异常", exc_info=True)
+
+    def start(self):
+        """启动批量发送线程"""
+        if not self.is_running:
+            self.is_running = True
+            self._recover()
+            self._thread = threading.Thread(target=self._flush_loop, name="APIClientFlush", daemon=True)
+            self._thread.start()
+            logger.info("批量上报已启动")
+
+    def stop(self, timeout: float = 5.0):
+        """停止发送线程，并尽量发送剩余事件"""
+        if not self.is_running:
+            return
+        self.is_running = False
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout)
+        while self._queue and self.flush():
+            pass
+        if self._queue:
+            if self.spool is not None:
+                logger.warning(f"停止时仍有 {len(self._queue)} 条事件未上报，已保存在本地缓存，下次启动时重新上报")
+            else:
+                logger.warning(f"停止时仍有 {len(self._queue)} 条事件未上报")
+        if self.spool is not None:
+            self.spool.close()
+        if self.sequence is not None:
+            self.sequence.close()
+        logger.info("批量上报已停止")
+
+
+def _to_ranges(seqs: List[int]) -> List[List[int]]:
+    """序号列表合并为闭区间 [[start, end], ...]"""
+    ranges: List[List[int]] = []
+    for seq in sorted(seqs):
+        if ranges and seq == ranges[-1][1] + 1:
+            ranges[-1][1] = seq
+        else:
+            ranges.append([seq, seq])
+    return ranges
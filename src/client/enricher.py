@@ -0,0 +1,140 @@
+# 事件元数据补充
+"""
+在上报前为事件批量补充文件元数据（meta 字段）：
+    size      文件大小（字节）
+    mtime     文件修改时间（ISO格式）
+    inode     inode 编号（Windows 上为文件索引号）
+    owner     文件属主（Windows 上为 None）
+    truncated 修改事件中文件比上次变小时为 True
+stat 在线程池中并发执行，不占用 watchdog 的回调线程
+短时间内同一路径的重复事件复用 stat 缓存；删除/移出事件直接跳过
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, Any, List, Optional
+
+try:
+    import pwd  # 仅 POSIX 可用
+except ImportError:
+    pwd = None
+
+logger = logging.getLogger("FileMonitor.Enricher")
+
+
+@lru_cache(maxsize=1024)
+def _owner_name(uid: int) -> Optional[str]:
+    """uid 转用户名（带缓存）"""
+    if pwd is None:
+        return None
+    try:
+        return pwd.getpwuid(uid).pw_name
+    except KeyError:
+        return str(uid)
+
+
+class MetadataEnricher:
+    def __init__(self, max_workers: int = 4, cache_ttl: float = 1.0,
+                 cache_size: int = 10000):
+        """
+        :param max_workers: stat 线程数
+        :param cache_ttl: stat 缓存有效期（秒）
+        :param cache_size: 缓存路径数上限（同时用于记录上次文件大小）
+        """
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="Enricher")
+        self._cache: Dict[str, tuple] = {}  # path -> (过期时间, meta)
+        self._last_sizes: "OrderedDict[str, int]" = OrderedDict()  # 用于判断截断
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _target_path(event: Dict[str, Any]) -> Optional[str]:
+        """需要 stat 的路径：移动事件取目标路径，删除事件跳过"""
+        event_type = event.get("event_type", "")
+        if event_type.startswith("deleted"):
+            return None
+        if event_type == "moved":
+            return event.get("dest_path")
+        return event.get("path")
+
+    def _cached(self, path: str, now: float) -> Optional[Dict[str, Any]]:
+        entry = self._cache.get(path)
+        if entry and entry[0] > now:
+            return entry[1]
+        return None
+
+    def _stat(self, path: str) -> Optional[Dict[str, Any]]:
+        """读取单个路径的元数据，文件已不存在时返回 None"""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return {
+            "size": st.st_size,
+            "mtime": datetime.fromtimestamp(st.st_mtime).isoformat(),
+            "inode": st.st_ino,
+            "owner": _owner_name(st.st_uid)
+        }
+
+    def _store(self, path: str, meta: Optional[Dict[str, Any]], now: float) -> None:
+        with self._lock:
+            if len(self._cache) >= self.cache_size:
+                # 先清理过期项，仍然太多则整体清空
+                for key in [k for k, v in self._cache.items() if v[0] <= now]:
+                    del self._cache[key]
+                if len(self._cache) >= self.cache_size:
+                    self._cache.clear()
+            self._cache[path] = (now + self.cache_ttl, meta)
+
+    def _check_truncated(self, event: Dict[str, Any], meta: Dict[str, Any]) -> Dict[str, Any]:
+        """修改事件中文件变小则标记截断"""
+        path = self._target_path(event)
+        with self._lock:
+            last_size = self._last_sizes.pop(path, None)
+            self._last_sizes[path] = meta["size"]
+            if len(self._last_sizes) > self.cache_size:
+                self._last_sizes.popitem(last=False)
+        if event.get("event_type") == "modified" and last_size is not None and meta["size"] < last_size:
+            return {**meta, "truncated": True}
+        return meta
+
+    def enrich(self, events: List[Dict[str, Any]]) -> None:
+        """
+        为一批事件补充 meta 字段（原地修改）
+        已经带 meta 的事件（如重新排队的事件）不再处理
+        :param events: 事件列表
+        """
+        now = time.monotonic()
+        pending = []
+        for event in events:
+            if "meta" in event:
+                continue
+            path = self._target_path(event)
+            if path is None:
+                event["meta"] = None
+            elif self._cached(path, now) is None:
+                pending.append(path)
+
+        # 去重后并发 stat
+        paths = list(dict.fromkeys(pending))
+        if paths:
+            for path, meta in zip(paths, self._pool.map(self._stat, paths)):
+                self._store(path, meta, now)
+
+        for event in events:
+            if "meta" in event:
+                continue
+            path = self._target_path(event)
+            with self._lock:
+                entry = self._cache.get(path)
+            meta = entry[1] if entry else None  # None：文件在上报前已被删除，或 stat 失败
+            event["meta"] = self._check_truncated(event, meta) if meta else None
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=False)
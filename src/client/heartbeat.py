@@ -8,24 +8,28 @@ from datetime import datetime
 logger = logging.getLogger("FileMonitor.Heartbeat")
 
 class HeartbeatClient:
-    def __init__(self, client_id: str, api_endpoint: str, api_key: str, interval: int):
+    def __init__(self, client_id: str, api_endpoint: str, api_key: str, interval: int, stream=None):
         """
 
         :param client_id: 客户端id
         :param api_endpoint:
         :param api_key:
         :param interval: 心跳间隔 int
+        :param stream: 长连接（StreamConnection），可用时心跳走长连接，否则走 HTTP
         """
         self.client_id = client_id
         self.api_endpoint = api_endpoint
         self.headers = {"X-API-Key": api_key}
         self.interval = interval
+        self.stream = stream
         self._timer = None
         self.is_running = False
 
     def _send_heartbeat(self):
         """发送心跳请求（带重试）"""
         try:
+            if self.stream is not None and self.stream.ensure_connected() and self.stream.ping(self.client_id):
+                return  # 长连接心跳成功
             data = {
                 "client_id": self.client_id,
                 "timestamp": datetime.now().isoformat()
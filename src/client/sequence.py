@@ -0,0 +1,75 @@
+# 事件序号
+"""
+每个客户端一个单调递增的事件序号，重启后继续递增
+状态文件：{"epoch": 序号空间标识, "next": 下一个可用序号}
+    epoch   状态文件新建时随机生成；文件丢失后序号从 1 重新开始，服务端据此重置去重窗口
+    按块预留序号（每次写盘预留 reserve 个），避免每个事件都写文件；
+    正常退出时写回准确值，异常退出时未用完的预留序号会在服务端表现为缺口
+"""
+import json
+import logging
+import os
+import threading
+import uuid
+
+logger = logging.getLogger("FileMonitor.Sequence")
+
+
+class SequenceCounter:
+    def __init__(self, state_file: str, reserve: int = 1000):
+        """
+        :param state_file: 状态文件路径
+        :param reserve: 每次写盘预留的序号数
+        """
+        self.state_file = state_file
+        self.reserve = max(1, reserve)
+        self._lock = threading.Lock()
+        self.epoch, self._next = self._load()
+        self._limit = self._next  # 已持久化的预留上限（不含）
+
+    def _load(self):
+        try:
+            with open(self.state_file, encoding="utf-8") as f:
+                state = json.load(f)
+            return state["epoch"], int(state["next"])
+        except FileNotFoundError:
+            epoch = uuid.uuid4().hex[:12]
+            logger.info(f"新建事件序号状态文件: {self.state_file}（epoch={epoch}）")
+            return epoch, 1
+        except (ValueError, KeyError):
+            epoch = uuid.uuid4().hex[:12]
+            logger.error(f"事件序号状态文件损坏，重新开始（epoch={epoch}）", exc_info=True)
+            return epoch, 1
+
+    def _save(self, next_value: int) -> None:
+        """原子写入（先写临时文件再替换）"""
+        directory = os.path.dirname(self.state_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.state_file}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"epoch": self.epoch, "next": next_value}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.state_file)
+
+    def next(self) -> int:
+        """取下一个序号"""
+        with self._lock:
+            if self._next >= self._limit:
+                self._limit = self._next + self.reserve
+                self._save(self._limit)
+            value = self._next
+            self._next += 1
+            return value
+
+    def peek(self) -> int:
+        """下一个将要分配的序号（异常退出后为预留上限，之前未使用的预留序号不会再分配）"""
+        with self._lock:
+            return self._next
+
+    def close(self) -> None:
+        """正常退出：写回准确的下一个序号，避免预留造成缺口"""
+        with self._lock:
+            self._save(self._next)
+            self._limit = self._next
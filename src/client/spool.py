@@ -0,0 +1,155 @@
+# 未确认事件的本地持久化缓存
+"""
+事件分配序号时写入，服务端确认后删除；进程重启后未确认的事件重新上报
+（包括本地缓冲溢出丢弃的、停止时仍在队列中的、崩溃时未发出的事件），
+服务端报告序号缺口时也从这里补发
+
+文件为追加写日志，每行一条 JSON：
+    {"epoch": ..., "high": n}   文件头（重写时写入）：序号空间和写入过的最大序号
+    {"add": 事件}                分配序号时写入
+    {"ack": [seq, ...]}          服务端确认后写入
+启动时重放日志；确认记录累计较多时重写文件，只保留未确认事件
+每条记录写入后 flush（进程崩溃不丢失），不逐条 fsync（断电可能丢失最后几条）
+"""
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List
+
+logger = logging.getLogger("FileMonitor.Spool")
+
+
+class EventSpool:
+    def __init__(self, path: str, epoch: str, max_events: int = 10000):
+        """
+        :param path: 日志文件路径
+        :param epoch: 当前序号空间（SequenceCounter.epoch），其它序号空间的事件在启动时取出重新编号
+        :param max_events: 保留的未确认事件上限，超出后丢弃最旧的
+        """
+        self.path = path
+        self.epoch = epoch
+        self.max_events = max_events
+        self.high_water = 0  # 写入过的最大序号（之后的序号从未分配给事件）
+        self._events: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()  # 序号 -> 事件
+        self._orphans: List[Dict[str, Any]] = []  # 其它序号空间的未确认事件
+        self._acks_since_compact = 0
+        self._lock = threading.Lock()
+        self._load()
+        self._compact()
+
+    def _load(self) -> None:
+        try:
+            f = open(self.path, encoding="utf-8")
+        except FileNotFoundError:
+            return
+        epoch = None
+        events: Dict[Any, "OrderedDict[int, Dict[str, Any]]"] = {}
+        with f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # 崩溃时写了一半的最后一行
+                if "high" in record:
+                    epoch = record.get("epoch")
+                    if epoch == self.epoch:
+                        self.high_water = max(self.high_water, record["high"])
+                elif "add" in record:
+                    event = record["add"]
+                    events.setdefault(event.get("seq_epoch"), OrderedDict())[event["seq"]] = event
+                    if event.get("seq_epoch") == self.epoch:
+                        self.high_water = max(self.high_water, event["seq"])
+                elif "ack" in record:
+                    for seq in record["ack"]:
+                        events.get(record.get("epoch", epoch), {}).pop(seq, None)
+        for event_epoch, pending in events.items():
+            if event_epoch == self.epoch:
+                self._events = pending
+            else:
+                for event in pending.values():
+                    event.pop("seq", None)
+                    event.pop("seq_epoch", None)
+                    self._orphans.append(event)
+        if self._events or self._orphans:
+            logger.info(f"本地缓存中有 {len(self._events) + len(self._orphans)} 条未确认事件，将重新上报")
+
+    def _compact(self) -> None:
+        """重写日志，只保留未确认事件（原子替换）"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"epoch": self.epoch, "high": self.high_water}) + "\n")
+            for event in self._events.values():
+                f.write(json.dumps({"add": event}, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self.path)
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._acks_since_compact = 0
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def add(self, event: Dict[str, Any]) -> List[int]:
+        """
+        缓存一个已分配序号的事件
+        :return: 因超出上限被丢弃的未确认序号（这些事件无法再补发）
+        """
+        with self._lock:
+            self._write({"add": event})
+            self._events[event["seq"]] = event
+            self.high_water = max(self.high_water, event["seq"])
+            evicted = []
+            while len(self._events) > self.max_events:
+                evicted.append(self._events.popitem(last=False)[0])
+            if evicted:
+                logger.warning(f"本地缓存已满，丢弃 {len(evicted)} 条最旧的未确认事件")
+            return evicted
+
+    def ack(self, seqs: List[int]) -> None:
+        """服务端已确认（或判定重复）的事件从缓存中删除"""
+        with self._lock:
+            seqs = [seq for seq in seqs if self._events.pop(seq, None) is not None]
+            if not seqs:
+                return
+            self._write({"ack": seqs, "epoch": self.epoch})
+            self._acks_since_compact += len(seqs)
+            if self._acks_since_compact > max(1000, len(self._events)):
+                self._file.close()
+                self._compact()
+
+    def pending(self) -> List[Dict[str, Any]]:
+        """所有未确认事件（按序号）"""
+        with self._lock:
+            return list(self._events.values())
+
+    def take_orphans(self) -> List[Dict[str, Any]]:
+        """取出其它序号空间的未确认事件（已去掉序号，需要重新分配）"""
+        with self._lock:
+            orphans, self._orphans = self._orphans, []
+            return orphans
+
+    def lookup(self, start: int, end: int):
+        """
+        查找区间内的序号
+        :return: (缓存中的事件, 不在缓存中的序号区间)
+        """
+        with self._lock:
+            found = sorted((event for seq, event in self._events.items() if start <= seq <= end),
+                           key=lambda e: e["seq"])
+        absent = []
+        cursor = start
+        for event in found:
+            if event["seq"] > cursor:
+                absent.append([cursor, event["seq"] - 1])
+            cursor = event["seq"] + 1
+        if cursor <= end:
+            absent.append([cursor, end])
+        return found, absent
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
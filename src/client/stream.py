@@ -0,0 +1,174 @@
+# 与服务端的长连接
+"""
+一个 WebSocket 连接承载事件上报和心跳（协议见服务端 /api/stream）：
+    连接后先发 auth 帧，之后每个 events/ping 帧带 id，等待同 id 的 ack/pong
+    服务端的 flow 帧（限流暂停/恢复）转交给 on_flow 回调
+依赖 websocket-client（可选）；未安装、连接失败或断开时各方法返回 None/False，调用方改用 HTTP
+"""
+import itertools
+import json
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    import websocket  # websocket-client
+except ImportError:
+    websocket = None
+
+logger = logging.getLogger("FileMonitor.Stream")
+
+
+def stream_url(endpoint: str) -> str:
+    """由事件接口推导长连接地址：http://host:8000/api/events -> ws://host:8000/api/stream"""
+    scheme, _, rest = endpoint.partition("://")
+    netloc = rest.split("/", 1)[0]
+    return f"{'wss' if scheme == 'https' else 'ws'}://{netloc}/api/stream"
+
+
+class StreamConnection:
+    def __init__(self, url: str, api_key: str, client_id: str, timeout: float = 5.0,
+                 reconnect_interval: float = 30.0, on_flow: Optional[Callable[[Dict], None]] = None):
+        """
+        :param url: 长连接地址（ws:// 或 wss://）
+        :param api_key: 认证key
+        :param client_id: 客户端id
+        :param timeout: 连接及等待 ack 的超时（秒）
+        :param reconnect_interval: 连接失败后至少间隔多久再重连（秒），期间调用方使用 HTTP
+        :param on_flow: 收到 flow 帧时的回调（在读取线程中调用）
+        """
+        self.url = url
+        self.api_key = api_key
+        self.client_id = client_id
+        self.timeout = timeout
+        self.reconnect_interval = reconnect_interval
+        self.on_flow = on_flow
+        self._ws = None
+        self._connect_lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._pending: Dict[int, List[Any]] = {}  # 帧 id -> [threading.Event, 响应帧]
+        self._ids = itertools.count(1)
+        self._next_attempt = 0.0
+        self._closed = False
+        if websocket is None:
+            logger.warning("未安装 websocket-client，长连接不可用，使用 HTTP 上报")
+
+    @property
+    def connected(self) -> bool:
+        return self._ws is not None
+
+    def ensure_connected(self) -> bool:
+        """未连接时尝试连接并认证（失败后 reconnect_interval 秒内不再尝试）"""
+        if self._ws is not None:
+            return True
+        if websocket is None or self._closed:
+            return False
+        with self._connect_lock:
+            if self._ws is not None:
+                return True
+            now = time.monotonic()
+            if now < self._next_attempt:
+                return False
+            self._next_attempt = now + self.reconnect_interval
+            ws = None
+            try:
+                ws = websocket.create_connection(self.url, timeout=self.timeout)
+                ws.send(json.dumps({"type": "auth", "api_key": self.api_key, "client_id": self.client_id}))
+                reply = json.loads(ws.recv())
+                if reply.get("type") != "auth_ok":
+                    raise ValueError(f"认证失败: {reply}")
+            except (websocket.WebSocketException, OSError, ValueError) as e:
+                logger.warning(f"长连接建立失败，使用 HTTP 上报: {e}")
+                if ws is not None:
+                    ws.close()
+                return False
+            ws.settimeout(None)  # 读取线程阻塞等待服务端消息
+            self._ws = ws
+            threading.Thread(target=self._read_loop, args=(ws,), name="StreamReader", daemon=True).start()
+            logger.info(f"长连接已建立: {self.url}")
+            return True
+
+    def _read_loop(self, ws) -> None:
+        """读取线程：ack/pong/error 交给等待中的请求，flow 交给回调"""
+        try:
+            while True:
+                message = json.loads(ws.recv())
+                kind = message.get("type")
+                if kind == "flow":
+                    if self.on_flow is not None:
+                        self.on_flow(message)
+                    continue
+                waiter = self._pending.pop(message.get("id"), None)
+                if waiter is not None:
+                    waiter[1] = message
+                    waiter[0].set()
+        except (websocket.WebSocketException, OSError, ValueError) as e:
+            if not self._closed:
+                logger.warning(f"长连接断开，改用 HTTP 上报: {e}")
+        finally:
+            self._drop(ws)
+
+    def _drop(self, ws) -> None:
+        """关闭连接，唤醒所有等待中的请求（响应为 None）"""
+        with self._send_lock:
+            if self._ws is ws:
+                self._ws = None
+        try:
+            ws.close()
+        except (websocket.WebSocketException, OSError):
+            pass
+        for request_id in list(self._pending):
+            waiter = self._pending.pop(request_id, None)
+            if waiter is not None:
+                waiter[0].set()
+
+    def _request(self, frame: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """发送一帧并等待同 id 的响应，连接不可用或超时返回 None"""
+        ws = self._ws
+        if ws is None:
+            return None
+        request_id = next(self._ids)
+        waiter = [threading.Event(), None]
+        self._pending[request_id] = waiter
+        try:
+            with self._send_lock:
+                ws.send(json.dumps(dict(frame, id=request_id)))
+        except (websocket.WebSocketException, OSError) as e:
+            logger.warning(f"长连接发送失败: {e}")
+            self._drop(ws)
+            return None
+        if not waiter[0].wait(self.timeout):
+            # 迟到的 ack 对应的事件会经 HTTP 重发，服务端按序号去重
+            logger.warning(f"长连接 {self.timeout} 秒未收到响应，断开重连")
+            self._drop(ws)
+            return None
+        return waiter[1]
+
+    def send_events(self, batch: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        发送一批事件
+        :param batch: 请求体，同 HTTP 批量接口（host, events, 可选 seq_epoch/abandoned）
+        :return: ack（内容同 HTTP 批量接口的响应体），失败返回 None
+        """
+        reply = self._request({"type": "events", **batch})
+        if reply is None:
+            return None
+        if reply.get("type") != "ack":
+            logger.error(f"长连接拒绝批量事件: {reply.get('detail')}")
+            return None
+        return reply
+
+    def ping(self, client_id: str) -> bool:
+        """发送心跳，收到 pong 返回 True"""
+        reply = self._request({"type": "ping", "client_id": client_id, "timestamp": datetime.now().isoformat()})
+        return reply is not None and reply.get("type") == "pong"
+
+    def close(self) -> None:
+        """关闭连接，之后不再重连"""
+        self._closed = True
+        ws = self._ws
+        if ws is not None:
+            self._drop(ws)
+            logger.info("长连接已关闭")
@@ -15,6 +15,12 @@ IGNORE_EXT = .exe;.mp3
 API_ENDPOINT = http://192.168.30.129:8000/api/events    ;远程API地址
 API_KEY = your-secret-key-123                           ;密钥
 MAX_RETRIES = 3                                         ;重试次数
+BATCH_SIZE = 100                                        ;单批最大事件数（随服务端限流预算自适应）
+FLUSH_INTERVAL = 1.0                                    ;批量发送间隔（秒，随服务端限流预算自适应）
+SEQUENCE_FILE = ../logs/sequence.json                   ;事件序号状态文件（重启后序号继续递增）
+SPOOL_FILE = ../logs/spool.ndjson                       ;未确认事件缓存（重启后重新上报，服务端报告缺口时补发）
+USE_STREAM = False                                      ;事件和心跳走 WebSocket 长连接（需安装 websocket-client，不可用时回退 HTTP）
+STREAM_URL =                                            ;长连接地址，留空时由 API_ENDPOINT 推导（ws://host:port/api/stream）
 
 [Logging]
 LOG_FILE = logs/file_changes.log  ; 日志文件路径
@@ -30,6 +36,23 @@ KEEP_ERROR_DAYS = 30              ; 错误日志保留天数
 INTERVAL_SECONDS = 30; 心跳间隔（秒）
 TIMEOUT_SECONDS = 90; 服务端超时阈值（秒）
 
+[Enrichment]
+ENABLED = True      ; 上报前补充文件元数据（大小/修改时间/inode/属主）
+WORKERS = 4         ; stat 线程数
+CACHE_TTL = 1.0     ; stat 缓存有效期（秒）
+
+[Polling]
+PATHS = D:/test_folder10  ; 使用增量轮询监控的路径（须同时出现在 WATCH_PATHS 中，适用于 SMB/NFS 挂载）
+MIN_INTERVAL = 2          ; 最短轮询间隔（秒），有变化时使用
+MAX_INTERVAL = 60         ; 最长轮询间隔（秒），长期无变化时逐步放大到此值
+IO_BUDGET = 2000          ; 每个路径每秒允许的 stat/列目录次数（0 不限制）
+FULL_SCAN_EVERY = 10      ; 每隔多少轮全量 stat 文件（发现内容修改）
+WORKERS = 4               ; 扫描线程数
+
+[Startup]
+WORKERS = 8               ; 启动时并发遍历/注册监控的线程数
+PROGRESS_INTERVAL = 5     ; 启动进度日志间隔（秒）
+
 """
 class ConfigError(Exception):
     """自定义配置异常"""
@@ -101,6 +124,41 @@ def read_config(config_path: str = "config.ini") -> Dict[str, Any]:
                     config_dict["max_retries"] = int(remote["MAX_RETRIES"])
                 except ValueError:
                     raise ConfigError("MAX_RETRIES 必须是整数")
+
+            # 批量上报：单批最大事件数
+            config_dict["batch_size"] = 100
+            if "BATCH_SIZE" in remote:
+                try:
+                    config_dict["batch_size"] = int(remote["BATCH_SIZE"])
+                except ValueError:
+                    raise ConfigError("BATCH_SIZE 必须是整数")
+
+            # 批量上报：基础发送间隔（秒）
+            config_dict["flush_interval"] = 1.0
+            if "FLUSH_INTERVAL" in remote:
+                try:
+                    config_dict["flush_interval"] = float(remote["FLUSH_INTERVAL"])
+                except ValueError:
+                    raise ConfigError("FLUSH_INTERVAL 必须是数字")
+
+            # 事件序号状态文件
+            config_dict["sequence_file"] = "sequence.json"
+            if "SEQUENCE_FILE" in remote:
+                config_dict["sequence_file"] = remote["SEQUENCE_FILE"].strip()
+
+            # 未确认事件缓存文件
+            config_dict["spool_file"] = "spool.ndjson"
+            if "SPOOL_FILE" in remote:
+                config_dict["spool_file"] = remote["SPOOL_FILE"].strip()
+
+            # 长连接（可选）
+            config_dict["use_stream"] = False
+            if "USE_STREAM" in remote:
+                try:
+                    config_dict["use_stream"] = config.getboolean("Remote", "USE_STREAM")
+                except ValueError:
+                    raise ConfigError("USE_STREAM 必须是 true/false, yes/no, on/off, 1/0")
+            config_dict["stream_url"] = remote.get("STREAM_URL", "").strip() or None
         # ---------------------- 解析 [Logging] ----------------------
         # 新增日志配置解析
         config_dict["log_file"] = "file_changes.log"
@@ -183,6 +241,95 @@ def read_config(config_path: str = "config.ini") -> Dict[str, Any]:
                 except ValueError:
                     raise ConfigError("HEARTBEAT_TIMEOUT 必须是整数")
 
+        # ---------------------- 解析 [Enrichment] ----------------------
+        config_dict["enrich_enabled"] = True
+        config_dict["enrich_workers"] = 4
+        config_dict["enrich_cache_ttl"] = 1.0
+
+        if "Enrichment" in config:
+            enrichment = config["Enrichment"]
+
+            if "ENABLED" in enrichment:
+                try:
+                    config_dict["enrich_enabled"] = config.getboolean("Enrichment", "ENABLED")
+                except ValueError:
+                    raise ConfigError("Enrichment.ENABLED 必须是 true/false")
+
+            if "WORKERS" in enrichment:
+                try:
+                    config_dict["enrich_workers"] = int(enrichment["WORKERS"])
+                except ValueError:
+                    raise ConfigError("Enrichment.WORKERS 必须是整数")
+
+            if "CACHE_TTL" in enrichment:
+                try:
+                    config_dict["enrich_cache_ttl"] = float(enrichment["CACHE_TTL"])
+                except ValueError:
+                    raise ConfigError("Enrichment.CACHE_TTL 必须是数字")
+
+        # ---------------------- 解析 [Polling] ----------------------
+        config_dict["polling_paths"] = []
+        config_dict["polling_min_interval"] = 2.0
+        config_dict["polling_max_interval"] = 60.0
+        config_dict["polling_io_budget"] = 2000.0
+        config_dict["polling_full_scan_every"] = 10
+        config_dict["polling_workers"] = 4
+        config_dict["polling_full_scan_interval"] = 120.0
+        config_dict["polling_full_scan_intervals"] = {}
+
+        if "Polling" in config:
+            polling = config["Polling"]
+
+            if "PATHS" in polling:
+                raw_paths = polling["PATHS"].split(",")
+                config_dict["polling_paths"] = [p.strip() for p in raw_paths if p.strip()]
+
+            for key, name, cast in [
+                ("MIN_INTERVAL", "polling_min_interval", float),
+                ("MAX_INTERVAL", "polling_max_interval", float),
+                ("IO_BUDGET", "polling_io_budget", float),
+                ("FULL_SCAN_EVERY", "polling_full_scan_every", int),
+                ("WORKERS", "polling_workers", int),
+                ("FULL_SCAN_INTERVAL", "polling_full_scan_interval", float),
+            ]:
+                if key in polling:
+                    try:
+                        config_dict[name] = cast(polling[key])
+                    except ValueError:
+                        raise ConfigError(f"Polling.{key} 必须是{'整数' if cast is int else '数字'}")
+
+            # 按路径单独设置全量 stat 间隔：路径=秒,路径=秒
+            if "FULL_SCAN_INTERVALS" in polling:
+                for item in polling["FULL_SCAN_INTERVALS"].split(","):
+                    if not item.strip():
+                        continue
+                    path, sep, seconds = item.rpartition("=")
+                    try:
+                        if not sep or not path.strip():
+                            raise ValueError
+                        config_dict["polling_full_scan_intervals"][path.strip()] = float(seconds)
+                    except ValueError:
+                        raise ConfigError(f"Polling.FULL_SCAN_INTERVALS 格式应为 路径=秒，多个用逗号分隔: {item.strip()}")
+
+        # ---------------------- 解析 [Startup] ----------------------
+        config_dict["startup_workers"] = 8
+        config_dict["startup_progress_interval"] = 5.0
+
+        if "Startup" in config:
+            startup = config["Startup"]
+
+            if "WORKERS" in startup:
+                try:
+                    config_dict["startup_workers"] = int(startup["WORKERS"])
+                except ValueError:
+                    raise ConfigError("Startup.WORKERS 必须是整数")
+
+            if "PROGRESS_INTERVAL" in startup:
+                try:
+                    config_dict["startup_progress_interval"] = float(startup["PROGRESS_INTERVAL"])
+                except ValueError:
+                    raise ConfigError("Startup.PROGRESS_INTERVAL 必须是数字")
+
         # 添加配置文件绝对路径
         config_dict["config_path"] = os.path.abspath(config_path)
 
@@ -3,7 +3,6 @@
 """
 
 import time
-from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 from logger import setup_logger, get_logger
 import logging
@@ -11,6 +10,12 @@ import os
 import socket
 from config_reader import read_config, ConfigError  #配置文件读取
 from client.api_client import APIClient         #客户端处理
+from client.enricher import MetadataEnricher    #事件元数据补充
+from client.sequence import SequenceCounter     #事件序号（去重/缺口检测）
+from client.spool import EventSpool             #未确认事件的持久化缓存
+from client.stream import StreamConnection, stream_url  #可选的 WebSocket 长连接
+from polling_scanner import IncrementalPollingObserver  #网络挂载点的增量轮询
+from watch_startup import WatchStartup          #大目录树并发注册监控
 from datetime import datetime
 # 在配置读取后初始化
 from client.heartbeat import HeartbeatClient
@@ -79,7 +84,8 @@ class FileChangeHandler(FileSystemEventHandler):
             "event_type": event_type,
             "timestamp": datetime.now().isoformat(),
             "path": src_path,
-            "dest_path": dest_path
+            "dest_path": dest_path,
+            "trace": {"observed": time.monotonic()}  # 延迟追踪：后续阶段由 APIClient 补充
         }
 
 if __name__ == "__main__":
@@ -94,15 +100,44 @@ if __name__ == "__main__":
         print(f"\033[31m配置错误：{e}\033[0m")
         exit(1)
 
+    # 初始化元数据补充（在发送线程中批量 stat，不占用监控回调线程）
+    enricher = None
+    if config["enrich_enabled"]:
+        enricher = MetadataEnricher(
+            max_workers=config["enrich_workers"],
+            cache_ttl=config["enrich_cache_ttl"]
+        )
+
+    host_id = os.environ.get("HOST_ID", socket.gethostname())  # 使用主机名作为默认ID
+
+    # 初始化长连接（可选）：事件和心跳共用一个连接，不可用时回退 HTTP
+    stream = None
+    if config["use_stream"]:
+        stream = StreamConnection(
+            url=config["stream_url"] or stream_url(config["api_endpoint"]),
+            api_key=config["api_key"],
+            client_id=host_id
+        )
+
+    # 事件序号与未确认事件缓存（重启后重新上报未确认的事件）
+    sequence = SequenceCounter(config["sequence_file"])
+    spool = EventSpool(config["spool_file"], sequence.epoch)
+
     # 初始化 API 客户端
     api_client = APIClient(
         endpoint=config["api_endpoint"],# 例如http://192.168.30.129:8000/api/events 传输的路由
         api_key=config["api_key"],      #认证key
-        max_retries=config["max_retries"]#最大重传次数
+        max_retries=config["max_retries"],#最大重传次数
+        batch_size=config["batch_size"],  #单批最大事件数
+        flush_interval=config["flush_interval"],#批量发送间隔
+        enricher=enricher,
+        sequence=sequence,  #持久化的事件序号
+        spool=spool,        #未确认事件缓存
+        stream=stream
     )
+    api_client.start()  # 启动批量发送线程
 
     # 创建事件处理器（添加 host_id 和 api_client）
-    host_id = os.environ.get("HOST_ID", socket.gethostname())  # 使用主机名作为默认ID
     event_handler = FileChangeHandler(
         ignore_ext=config["ignore_ext"],
         api_client=api_client,  #客户端实例
@@ -122,8 +157,10 @@ if __name__ == "__main__":
         print("\033[31m错误：没有有效的监控路径！\033[0m")
         exit(1)
 
-    # 初始化监控器
-    observer = Observer()
+    # 监控方式：[Polling] PATHS 中的路径使用增量轮询，其余使用原生事件
+    polling_paths = {os.path.normcase(os.path.abspath(p)) for p in config["polling_paths"]}
+    native_roots = [p for p in valid_paths if os.path.normcase(p) not in polling_paths]
+    polling_roots = [p for p in valid_paths if os.path.normcase(p) in polling_paths]
 
     # 初始化心跳客户端
     heartbeat_client = HeartbeatClient(
@@ -131,19 +168,39 @@ if __name__ == "__main__":
         api_endpoint=f"{config['api_endpoint'].rstrip('/')}/heartbeat",
         api_key=config["api_key"],
         # interval=config.getint("Heartbeat", "INTERVAL_SECONDS", fallback=30)
-        interval=config["heartbeat_interval"]
+        interval=config["heartbeat_interval"],
+        stream=stream
     )
     heartbeat_client.start()
 
-    # 添加监控路径
-    for path in valid_paths:
-        observer.schedule(
-            event_handler,
-            path,
-            recursive=config["recursive"]
-        )
-        print(f"监控路径：{path} (递归：{config['recursive']})")
-    observer.start()
+    # 轮询 observer：[Polling] PATHS 中的路径，以及超出 inotify 额度的子树（包括之后新建的一级子目录）
+    polling_observer = IncrementalPollingObserver(
+        min_interval=config["polling_min_interval"],
+        max_interval=config["polling_max_interval"],
+        io_budget=config["polling_io_budget"],
+        full_scan_every=config["polling_full_scan_every"],
+        full_scan_interval=config["polling_full_scan_interval"],
+        full_scan_intervals=config["polling_full_scan_intervals"],
+        workers=config["polling_workers"]
+    )
+    polling_observer.start()
+
+    # 添加原生监控路径：按 inotify 额度规划，多线程并发注册，超出额度的子树改用轮询
+    startup = WatchStartup(
+        workers=config["startup_workers"],
+        progress_interval=config["startup_progress_interval"]
+    )
+    plan = startup.plan(native_roots, config["recursive"])
+    observers = startup.register(event_handler, plan, fallback=polling_observer)
+    for root in native_roots:
+        print(f"监控路径：{root} (递归：{config['recursive']}，方式：原生事件)")
+    for path in plan.overflow:
+        print(f"监控路径：{path} (递归：True，方式：轮询，超出 inotify 额度)")
+
+    # 添加轮询监控路径
+    for path in polling_roots:
+        polling_observer.schedule(event_handler, path, recursive=config["recursive"])
+        print(f"监控路径：{path} (递归：{config['recursive']}，方式：轮询)")
     print("监控已启动...")
     # 在程序退出时停止心跳
     try:
@@ -154,6 +211,15 @@ if __name__ == "__main__":
         raise
     except KeyboardInterrupt:
         heartbeat_client.stop()#停止心跳发送
-        observer.stop()
+        api_client.stop()#发送剩余事件
+        if stream:
+            stream.close()
+        if enricher:
+            enricher.close()
+        for observer in observers:
+            observer.stop()
+        polling_observer.stop()
         print("\n监控已停止。")
-    observer.join()
\ No newline at end of file
+    for observer in observers:
+        observer.join()
+    polling_observer.join()
\ No newline at end of file
@@ -0,0 +1,405 @@
+"""
+增量轮询监控（用于 SMB/NFS 等原生事件不可靠的挂载点）
+
+与 watchdog 自带的 PollingObserver 相比：
+    1. 跳过未变化的目录：目录 mtime 未变时不重新列目录，只 stat 目录本身
+       （文件内容修改不会改变目录 mtime，因此每隔 full_scan_every 轮、且最长每隔 full_scan_interval 秒
+        做一次全量文件 stat；full_scan_interval 可按监控路径单独设置）
+    2. 目录扫描分散到线程池并发执行，每个监控根目录有独立的 I/O 预算（每秒 stat/列目录次数）
+       和并发上限；额度不足时在该根目录的 emitter 线程中等待，不占用共享线程池
+    3. 轮询间隔自适应：有变化时缩短到 min_interval，持续无变化时逐步放大到 max_interval
+
+用法与 Observer 相同：
+    observer = IncrementalPollingObserver(min_interval=2, max_interval=60)
+    observer.schedule(handler, path, recursive=True)
+    observer.start()
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from functools import partial
+from typing import Dict, List, Optional, Set, Tuple
+
+from watchdog.events import (
+    DirCreatedEvent,
+    DirDeletedEvent,
+    DirMovedEvent,
+    FileCreatedEvent,
+    FileDeletedEvent,
+    FileModifiedEvent,
+    FileMovedEvent,
+)
+from watchdog.observers.api import DEFAULT_EMITTER_TIMEOUT, DEFAULT_OBSERVER_TIMEOUT, BaseObserver, EventEmitter
+
+logger = logging.getLogger("FileMonitor.Polling")
+
+
+class IOBudget:
+    """每秒 I/O 次数预算（线程安全的令牌桶：扫描线程只记账，提交扫描前由 emitter 线程等待额度）"""
+
+    def __init__(self, ops_per_sec: float):
+        """
+        :param ops_per_sec: 每秒允许的 stat/列目录次数，<=0 表示不限制
+        """
+        self.rate = ops_per_sec
+        self._tokens = ops_per_sec
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def take(self, n: int = 1) -> None:
+        """记账 n 次 I/O，不等待（允许透支，由 wait 补偿）"""
+        if self.rate <= 0:
+            return
+        with self._lock:
+            self._refill()
+            self._tokens -= n
+
+    def wait(self, stopped: Optional[threading.Event] = None) -> None:
+        """等待透支的额度恢复；stopped 被设置时提前返回"""
+        if self.rate <= 0:
+            return
+        with self._lock:
+            self._refill()
+            deficit = -self._tokens
+        if deficit > 0:
+            if stopped is not None:
+                stopped.wait(deficit / self.rate)
+            else:
+                time.sleep(deficit / self.rate)
+
+
+class _DirState:
+    """目录上次扫描的结果"""
+    __slots__ = ("mtime_ns", "inode", "files", "subdirs")
+
+    def __init__(self, mtime_ns: int, inode: int, files: Dict[str, Tuple[int, int, int]], subdirs: Set[str]):
+        self.mtime_ns = mtime_ns
+        self.inode = inode
+        self.files = files      # 文件名 -> (inode, size, mtime_ns)
+        self.subdirs = subdirs  # 子目录名
+
+
+class _ScanResult:
+    """单个目录的扫描结果（在线程池中生成）"""
+    __slots__ = ("path", "state", "created", "deleted", "modified")
+
+    def __init__(self, path: str, state: Optional[_DirState]):
+        self.path = path
+        self.state = state  # None 表示目录已不存在
+        self.created: List[Tuple[str, int]] = []  # (文件路径, inode)
+        self.deleted: List[Tuple[str, int]] = []
+        self.modified: List[str] = []
+
+
+class TreeScanner:
+    """对一个根目录做增量扫描"""
+
+    def __init__(self, root: str, recursive: bool, pool: ThreadPoolExecutor,
+                 budget: IOBudget, full_scan_every: int = 10, concurrency: int = 2,
+                 stopped: Optional[threading.Event] = None, full_scan_interval: float = 120.0):
+        """
+        :param root: 根目录
+        :param recursive: 是否递归
+        :param pool: 共享线程池
+        :param budget: 本根目录的 I/O 预算
+        :param full_scan_every: 每隔多少轮做一次全量文件 stat
+        :param full_scan_interval: 距上次全量 stat 超过该秒数时本轮也做全量 stat（<=0 只按轮数）
+        :param concurrency: 本根目录同时在线程池中扫描的目录数上限
+        :param stopped: 停止标志（等待额度时提前结束）
+        """
+        self.root = root
+        self.recursive = recursive
+        self.pool = pool
+        self.budget = budget
+        self.full_scan_every = max(1, full_scan_every)
+        self.concurrency = max(1, concurrency)
+        self.stopped = stopped
+        self.full_scan_interval = full_scan_interval
+        self._dirs: Dict[str, _DirState] = {}
+        self._passes = 0
+        self._last_full_scan = 0.0  # 上次全量 stat（或建立基线）的时间（单调时钟）
+
+    def _scan_dir(self, path: str, old: Optional[_DirState], check_files: bool) -> _ScanResult:
+        """扫描单个目录：mtime 未变且不要求检查文件时直接复用上次结果"""
+        self.budget.take()
+        try:
+            st = os.stat(path)
+        except OSError:
+            return _ScanResult(path, None)
+
+        if old is not None and st.st_mtime_ns == old.mtime_ns:
+            result = _ScanResult(path, old)
+            if check_files:
+                self._check_files(path, old, result)
+            return result
+
+        # 目录有增删：重新列目录
+        self.budget.take()
+        files: Dict[str, Tuple[int, int, int]] = {}
+        subdirs: Set[str] = set()
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.add(entry.name)
+                            continue
+                        self.budget.take()
+                        est = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue  # 列目录和 stat 之间被删除
+                    files[entry.name] = (est.st_ino, est.st_size, est.st_mtime_ns)
+        except OSError:
+            return _ScanResult(path, None)
+
+        result = _ScanResult(path, _DirState(st.st_mtime_ns, st.st_ino, files, subdirs))
+        old_files = old.files if old is not None else {}
+        for name, info in files.items():
+            previous = old_files.get(name)
+            if previous is None or previous[0] != info[0]:
+                result.created.append((os.path.join(path, name), info[0]))
+                if previous is not None:
+                    result.deleted.append((os.path.join(path, name), previous[0]))
+            elif previous[1:] != info[1:]:
+                result.modified.append(os.path.join(path, name))
+        for name, previous in old_files.items():
+            if name not in files:
+                result.deleted.append((os.path.join(path, name), previous[0]))
+        return result
+
+    def _check_files(self, path: str, state: _DirState, result: _ScanResult) -> None:
+        """全量轮：目录未变时逐个 stat 已知文件，发现内容修改"""
+        for name, (inode, size, mtime_ns) in list(state.files.items()):
+            self.budget.take()
+            try:
+                st = os.stat(os.path.join(path, name), follow_symlinks=False)
+            except OSError:
+                continue  # 删除会体现在目录 mtime 上，下轮处理
+            if st.st_ino == inode and (st.st_size != size or st.st_mtime_ns != mtime_ns):
+                state.files[name] = (inode, st.st_size, st.st_mtime_ns)
+                result.modified.append(os.path.join(path, name))
+
+    def _drop_subtree(self, path: str, dirs_deleted: List[Tuple[str, int]],
+                      files_deleted: List[Tuple[str, int]]) -> None:
+        """子目录消失：整个子树记为删除"""
+        state = self._dirs.pop(path, None)
+        if state is None:
+            return
+        for name in state.subdirs:
+            self._drop_subtree(os.path.join(path, name), dirs_deleted, files_deleted)
+        for name, info in state.files.items():
+            files_deleted.append((os.path.join(path, name), info[0]))
+        dirs_deleted.append((path, state.inode))
+
+    def scan(self) -> list:
+        """
+        扫描一轮
+        :return: watchdog 事件列表（首轮只建立基线，不产生事件）
+        """
+        baseline = not self._dirs
+        now = time.monotonic()
+        overdue = 0 < self.full_scan_interval <= now - self._last_full_scan
+        check_files = (self._passes % self.full_scan_every == 0 or overdue) and not baseline
+        if check_files or baseline:
+            self._last_full_scan = now
+        self._passes += 1
+
+        files_created: List[Tuple[str, int]] = []
+        files_deleted: List[Tuple[str, int]] = []
+        files_modified: List[str] = []
+        dirs_created: List[Tuple[str, int]] = []
+        dirs_deleted: List[Tuple[str, int]] = []
+
+        # 在调用线程（emitter）中等待额度后再提交，线程池中的扫描不会因额度而阻塞其它根目录
+        todo = deque([(self.root, self._dirs.get(self.root))])
+        pending = set()
+        while todo or pending:
+            while todo and len(pending) < self.concurrency:
+                self.budget.wait(self.stopped)
+                if self.stopped is not None and self.stopped.is_set():
+                    return []  # 停止监控，放弃本轮
+                path, state = todo.popleft()
+                pending.add(self.pool.submit(self._scan_dir, path, state, check_files))
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                if result.state is None:
+                    if result.path == self.root:
+                        raise FileNotFoundError(self.root)
+                    continue  # 子目录在列出后被删除，下轮由父目录处理
+                old = self._dirs.get(result.path)
+                self._dirs[result.path] = result.state
+                files_created.extend(result.created)
+                files_deleted.extend(result.deleted)
+                files_modified.extend(result.modified)
+                if not self.recursive:
+                    continue
+
+                if old is not None and old is not result.state:
+                    for name in old.subdirs - result.state.subdirs:
+                        self._drop_subtree(os.path.join(result.path, name), dirs_deleted, files_deleted)
+                for name in result.state.subdirs:
+                    child = os.path.join(result.path, name)
+                    child_state = self._dirs.get(child)
+                    if child_state is None and not baseline:
+                        dirs_created.append((child, -1))
+                    todo.append((child, child_state))
+
+        if baseline:
+            return []
+        # 新目录的 inode 在扫描后才知道
+        dirs_created = [(path, self._dirs[path].inode if path in self._dirs else -1) for path, _ in dirs_created]
+        return self._build_events(files_created, files_deleted, files_modified, dirs_created, dirs_deleted)
+
+    @staticmethod
+    def _build_events(files_created, files_deleted, files_modified, dirs_created, dirs_deleted) -> list:
+        """按 inode 配对删除/新建得到移动事件，其余按删除、移动、新建、修改顺序输出"""
+        events = []
+        created_dirs = {inode: path for path, inode in dirs_created if inode >= 0}
+        moved_dirs = []
+        for path, inode in dirs_deleted:
+            if inode in created_dirs:
+                moved_dirs.append((path, created_dirs.pop(inode)))
+        moved_src = {src for src, _ in moved_dirs}
+        moved_dest = {dest for _, dest in moved_dirs}
+
+        def under(path: str, roots: Set[str]) -> bool:
+            """路径是否位于已整体移动的目录中（这些子项不再单独上报）"""
+            parent = os.path.dirname(path)
+            while parent and parent not in roots:
+                next_parent = os.path.dirname(parent)
+                if next_parent == parent:
+                    return False
+                parent = next_parent
+            return bool(parent)
+
+        # 只保留最外层的目录移动
+        moved_dirs = [(src, dest) for src, dest in moved_dirs if not under(src, moved_src)]
+        files_deleted = [(p, i) for p, i in files_deleted if not under(p, moved_src)]
+        files_created = [(p, i) for p, i in files_created if not under(p, moved_dest)]
+        created_by_inode = {inode: path for path, inode in files_created}
+        moved_files = []
+        for path, inode in files_deleted:
+            dest = created_by_inode.pop(inode, None)
+            if dest is not None:
+                moved_files.append((path, dest))
+        moved_file_src = {src for src, _ in moved_files}
+        created_paths = set(created_by_inode.values())
+
+        events.extend(FileDeletedEvent(p) for p, _ in files_deleted if p not in moved_file_src)
+        events.extend(DirDeletedEvent(p) for p, i in dirs_deleted
+                      if p not in moved_src and not under(p, moved_src))
+        events.extend(DirMovedEvent(src, dest) for src, dest in moved_dirs)
+        events.extend(FileMovedEvent(src, dest) for src, dest in moved_files)
+        events.extend(DirCreatedEvent(p) for p, _ in dirs_created
+                      if p not in moved_dest and not under(p, moved_dest))
+        events.extend(FileCreatedEvent(p) for p, _ in files_created if p in created_paths)
+        events.extend(FileModifiedEvent(p) for p in files_modified)
+        return events
+
+
+def _lookup_interval(intervals: Dict[str, float], path: str, default: float) -> float:
+    """按路径查找全量 stat 间隔：取最近的已配置祖先目录（含自身），都未配置时用默认值"""
+    path = os.path.normcase(os.path.abspath(path))
+    while True:
+        if path in intervals:
+            return intervals[path]
+        parent = os.path.dirname(path)
+        if parent == path:
+            return default
+        path = parent
+
+
+class IncrementalPollingEmitter(EventEmitter):
+    """增量轮询 emitter（每个监控根目录一个）"""
+
+    def __init__(self, event_queue, watch, *, timeout: float = DEFAULT_EMITTER_TIMEOUT,
+                 event_filter=None, pool: ThreadPoolExecutor = None, min_interval: float = 2.0,
+                 max_interval: float = 60.0, io_budget: float = 2000, full_scan_every: int = 10,
+                 concurrency: int = 2, full_scan_interval: float = 120.0,
+                 full_scan_intervals: Optional[Dict[str, float]] = None):
+        super().__init__(event_queue, watch, timeout=timeout, event_filter=event_filter)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+        full_scan_interval = _lookup_interval(full_scan_intervals or {}, watch.path, full_scan_interval)
+        self._scanner = TreeScanner(watch.path, watch.is_recursive, pool, IOBudget(io_budget), full_scan_every,
+                                    concurrency, self.stopped_event, full_scan_interval)
+        self._baseline_done = False
+
+    def _next_interval(self, changes: int) -> float:
+        """有变化时回到最短间隔，无变化时每轮放大 1.5 倍"""
+        if changes:
+            return self.min_interval
+        return min(self.max_interval, self.interval * 1.5)
+
+    def queue_events(self, timeout: float) -> None:
+        # 首轮建立基线（在 emitter 线程中执行，不阻塞 observer.start()）
+        if self._baseline_done and self.stopped_event.wait(self.interval):
+            return
+        self._baseline_done = True
+        if not self.should_keep_running():
+            return
+
+        began = time.monotonic()
+        try:
+            events = self._scanner.scan()
+        except OSError:
+            logger.warning(f"轮询根目录不可访问: {self.watch.path}")
+            self.queue_event(DirDeletedEvent(self.watch.path))
+            self.stop()
+            return
+        for event in events:
+            self.queue_event(event)
+
+        self.interval = self._next_interval(len(events))
+        logger.debug(f"轮询 {self.watch.path}: {len(events)} 个变化，耗时 "
+                     f"{time.monotonic() - began:.2f}s，下次间隔 {self.interval:.1f}s")
+
+
+class IncrementalPollingObserver(BaseObserver):
+    """增量轮询 observer，所有根目录共用一个扫描线程池"""
+
+    def __init__(self, *, min_interval: float = 2.0, max_interval: float = 60.0,
+                 io_budget: float = 2000, full_scan_every: int = 10, workers: int = 4,
+                 full_scan_interval: float = 120.0, full_scan_intervals: Optional[Dict[str, float]] = None,
+                 timeout: float = DEFAULT_OBSERVER_TIMEOUT):
+        """
+        :param min_interval: 最短轮询间隔（秒）
+        :param max_interval: 最长轮询间隔（秒）
+        :param io_budget: 每个根目录每秒允许的 stat/列目录次数（<=0 不限制）
+        :param full_scan_every: 每隔多少轮全量 stat 文件以发现内容修改
+        :param workers: 扫描线程数（每个根目录最多同时占用一半，其余留给其它根目录）
+        :param full_scan_interval: 全量 stat 的最长间隔（秒，<=0 只按 full_scan_every 轮数）
+        :param full_scan_intervals: 按监控路径单独设置的全量 stat 最长间隔 {路径: 秒}，
+                                    对该路径及其下的子树生效（如超出 inotify 额度后改为轮询的子树）
+        """
+        full_scan_intervals = {
+            os.path.normcase(os.path.abspath(path)): seconds
+            for path, seconds in (full_scan_intervals or {}).items()
+        }
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="PollingScan")
+        emitter_class = partial(
+            IncrementalPollingEmitter,
+            pool=self._pool,
+            min_interval=min_interval,
+            max_interval=max_interval,
+            io_budget=io_budget,
+            full_scan_every=full_scan_every,
+            concurrency=max(1, workers // 2),
+            full_scan_interval=full_scan_interval,
+            full_scan_intervals=full_scan_intervals
+        )
+        super().__init__(emitter_class, timeout=timeout)
+
+    def on_thread_stop(self) -> None:
+        super().on_thread_stop()
+        self._pool.shutdown(wait=False)
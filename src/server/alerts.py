@@ -0,0 +1,290 @@
+# 告警规则引擎
+"""
+规则文件为 JSON 数组，每条规则：
+    id                规则标识
+    pattern           路径模式：
+                          /finance/**   前缀（该目录及其下任意层级）
+                          *.conf        扩展名（任意目录，不区分大小写）
+                          /etc/hosts    精确路径
+                          其它含 * ? [ 的模式按 fnmatch 匹配完整路径（* 可跨越目录）
+    host              只匹配该客户端（省略表示所有客户端）
+    event_types       只匹配这些事件类型（前缀匹配，"deleted" 可匹配 "deleted/moved out"；省略表示所有）
+    min_count         窗口内匹配次数达到该值时触发（默认 1）
+    window_seconds    滑动窗口长度（秒，默认 60）
+    cooldown_seconds  同一规则、同一客户端两次告警的最短间隔（默认等于 window_seconds）
+    description       告警说明（可选）
+示例：
+    {"id": "finance-deletes", "pattern": "/finance/**", "event_types": ["deleted"],
+     "min_count": 500, "window_seconds": 60}
+    {"id": "conf-change", "pattern": "*.conf", "host": "web-01"}
+
+所有规则的路径模式编译成一个匹配器，每个事件的匹配开销与规则总数无关：
+    前缀树    按路径分段逐层下降，沿途收集前缀规则，以及挂在字面前缀节点上的 fnmatch 规则
+    扩展名表  扩展名 -> 规则
+    精确表    完整路径 -> 规则
+计数按 (规则, 客户端) 使用分桶的滑动窗口；窗口已清空且冷却期已过的 (规则, 客户端) 定期清理
+"""
+import fnmatch
+import json
+import logging
+import os
+import re
+from collections import deque
+from datetime import datetime
+from typing import Deque, Dict, List, Optional, Tuple
+
+from path_index import split_path
+
+logger = logging.getLogger("FileMonitorServer.Alerts")
+
+GLOB_CHARS = re.compile(r"[*?\[]")
+EXTENSION_PATTERN = re.compile(r"\*(\.[^*?\[/.]+)")
+
+
+class AlertRule:
+    __slots__ = ("id", "pattern", "host", "event_types", "min_count", "window_seconds",
+                 "cooldown_seconds", "description")
+
+    def __init__(self, id: str, pattern: str, host: Optional[str] = None, event_types: Tuple[str, ...] = (),
+                 min_count: int = 1, window_seconds: float = 60.0, cooldown_seconds: Optional[float] = None,
+                 description: str = ""):
+        self.id = id
+        self.pattern = pattern
+        self.host = host
+        self.event_types = tuple(event_types)
+        self.min_count = min_count
+        self.window_seconds = window_seconds
+        self.cooldown_seconds = window_seconds if cooldown_seconds is None else cooldown_seconds
+        self.description = description
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "AlertRule":
+        """由规则文件中的一项创建，字段不合法时抛出 ValueError"""
+        if not isinstance(data, dict) or not data.get("id") or not data.get("pattern"):
+            raise ValueError(f"规则必须包含 id 和 pattern: {data}")
+        try:
+            rule = cls(
+                id=str(data["id"]),
+                pattern=str(data["pattern"]),
+                host=data.get("host"),
+                event_types=tuple(data.get("event_types") or ()),
+                min_count=int(data.get("min_count", 1)),
+                window_seconds=float(data.get("window_seconds", 60)),
+                cooldown_seconds=None if data.get("cooldown_seconds") is None else float(data["cooldown_seconds"]),
+                description=data.get("description", "")
+            )
+        except (TypeError, ValueError):
+            raise ValueError(f"规则 {data['id']} 的 min_count/window_seconds/cooldown_seconds 必须是数字")
+        if rule.min_count < 1 or rule.window_seconds <= 0:
+            raise ValueError(f"规则 {rule.id} 的 min_count 必须 >= 1，window_seconds 必须 > 0")
+        return rule
+
+
+def load_rules(path: str) -> List[AlertRule]:
+    """读取规则文件；文件不存在时返回空列表，不合法的规则记录错误后跳过"""
+    if not os.path.exists(path):
+        logger.info(f"未找到告警规则文件 {path}，告警未启用")
+        return []
+    with open(path, encoding="utf-8") as f:
+        items = json.load(f)
+    rules = []
+    for item in items:
+        try:
+            rules.append(AlertRule.from_dict(item))
+        except ValueError as e:
+            logger.error(f"跳过告警规则: {e}")
+    logger.info(f"已加载 {len(rules)} 条告警规则: {path}")
+    return rules
+
+
+def _normalize(path: str) -> str:
+    return path.replace("\\", "/")
+
+
+class _TrieNode:
+    __slots__ = ("children", "prefix_rules", "glob_rules")
+
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        self.prefix_rules: List[AlertRule] = []
+        self.glob_rules: List[Tuple[AlertRule, "re.Pattern"]] = []
+
+
+class PathMatcher:
+    """把所有规则的路径模式编译到一起"""
+
+    def __init__(self, rules: List[AlertRule] = ()):
+        self.root = _TrieNode()
+        self.extensions: Dict[str, List[AlertRule]] = {}
+        self.exact: Dict[str, List[AlertRule]] = {}
+        for rule in rules:
+            self.add(rule)
+
+    def _node(self, parts: List[str]) -> _TrieNode:
+        node = self.root
+        for part in parts:
+            node = node.children.setdefault(part, _TrieNode())
+        return node
+
+    def add(self, rule: AlertRule) -> None:
+        pattern = _normalize(rule.pattern)
+        if pattern in ("*", "**", "/**"):
+            self.root.prefix_rules.append(rule)
+        elif pattern.endswith("/**") and not GLOB_CHARS.search(pattern[:-3]):
+            self._node(split_path(pattern[:-3])).prefix_rules.append(rule)
+        elif EXTENSION_PATTERN.fullmatch(pattern):
+            self.extensions.setdefault(pattern[1:].lower(), []).append(rule)
+        elif not GLOB_CHARS.search(pattern):
+            self.exact.setdefault("/".join(split_path(pattern)), []).append(rule)
+        else:
+            # 通用模式：挂在第一个通配分段之前的字面前缀上，只对该前缀下的路径做 fnmatch
+            parts = split_path(pattern)
+            literal = []
+            for part in parts:
+                if GLOB_CHARS.search(part):
+                    break
+                literal.append(part)
+            regex = re.compile(fnmatch.translate(pattern))
+            self._node(literal).glob_rules.append((rule, regex))
+
+    def match(self, path: str) -> List[AlertRule]:
+        """路径匹配到的所有规则"""
+        path = _normalize(path)
+        parts = split_path(path)
+        matched = list(self.exact.get("/".join(parts), ()))
+        if parts:
+            extension = os.path.splitext(parts[-1])[1].lower()
+            if extension:
+                matched.extend(self.extensions.get(extension, ()))
+        node = self.root
+        depth = 0
+        while node is not None:
+            matched.extend(node.prefix_rules)
+            for rule, regex in node.glob_rules:
+                if regex.match(path):
+                    matched.append(rule)
+            if depth == len(parts):
+                break
+            node = node.children.get(parts[depth])
+            depth += 1
+        return matched
+
+
+class SlidingWindowCounter:
+    """分桶滑动窗口计数：窗口分成 buckets 个桶，过期的桶整体移出（精度为 window / buckets）"""
+    __slots__ = ("width", "buckets", "_counts", "total")
+
+    def __init__(self, window: float, buckets: int = 10):
+        self.width = window / buckets
+        self.buckets = buckets
+        self._counts: Deque[List[int]] = deque()  # [桶序号, 计数]
+        self.total = 0
+
+    def add(self, now: float, n: int = 1) -> int:
+        """记录 n 次，返回窗口内的总次数"""
+        index = int(now // self.width)
+        while self._counts and self._counts[0][0] <= index - self.buckets:
+            self.total -= self._counts.popleft()[1]
+        if self._counts and self._counts[-1][0] == index:
+            self._counts[-1][1] += n
+        else:
+            self._counts.append([index, n])
+        self.total += n
+        return self.total
+
+    def expired(self, now: float) -> bool:
+        """窗口内的桶是否都已过期"""
+        return not self._counts or self._counts[-1][0] <= int(now // self.width) - self.buckets
+
+
+class AlertEngine:
+    def __init__(self, rules: List[AlertRule] = (), buckets: int = 10, sweep_interval: float = 60.0):
+        """
+        :param rules: 告警规则
+        :param buckets: 每个滑动窗口的桶数
+        :param sweep_interval: 清理空闲计数的间隔（秒）
+        """
+        self.rules = list(rules)
+        self.buckets = buckets
+        self.sweep_interval = sweep_interval
+        self.matcher = PathMatcher(self.rules)
+        self._rules_by_id = {rule.id: rule for rule in self.rules}
+        self._counters: Dict[Tuple[str, str], SlidingWindowCounter] = {}
+        self._last_fired: Dict[Tuple[str, str], float] = {}
+        self._last_sweep = 0.0
+
+    def evaluate(self, event: Dict, now: float) -> List[Dict]:
+        """
+        评估单个事件
+        :param event: 事件（host, path, event_type, dest_path）
+        :param now: 当前时间（epoch秒）
+        :return: 触发的告警
+        """
+        host, event_type = event["host"], event["event_type"]
+        rules = self.matcher.match(event["path"])
+        if event.get("dest_path"):
+            rules += self.matcher.match(event["dest_path"])
+        fired = []
+        seen = set()
+        for rule in rules:
+            if rule in seen:
+                continue  # 源路径和目标路径匹配到同一规则时只计一次
+            seen.add(rule)
+            if rule.host is not None and rule.host != host:
+                continue
+            if rule.event_types and not event_type.startswith(rule.event_types):
+                continue
+            key = (rule.id, host)
+            counter = self._counters.get(key)
+            if counter is None:
+                counter = self._counters[key] = SlidingWindowCounter(rule.window_seconds, self.buckets)
+            count = counter.add(now)
+            if count < rule.min_count:
+                continue
+            last = self._last_fired.get(key)
+            if last is not None and now - last < rule.cooldown_seconds:
+                continue
+            self._last_fired[key] = now
+            fired.append({
+                "rule_id": rule.id,
+                "description": rule.description,
+                "host": host,
+                "path": event["path"],
+                "event_type": event_type,
+                "count": count,
+                "min_count": rule.min_count,
+                "window_seconds": rule.window_seconds,
+                "fired_at": datetime.fromtimestamp(now).isoformat()
+            })
+        return fired
+
+    def evaluate_events(self, events: List[Dict], now: float) -> List[Dict]:
+        """评估一批事件"""
+        fired = []
+        for event in events:
+            fired.extend(self.evaluate(event, now))
+        if now - self._last_sweep >= self.sweep_interval:
+            self.sweep(now)
+        return fired
+
+    def sweep(self, now: float) -> int:
+        """
+        删除窗口已清空的计数器和冷却期已过的告警时间（否则每个出现过的 (规则, 客户端) 都会一直保留）
+        :return: 删除的计数器数
+        """
+        self._last_sweep = now
+        expired = [key for key, counter in self._counters.items() if counter.expired(now)]
+        for key in expired:
+            del self._counters[key]
+        for key, last in list(self._last_fired.items()):
+            rule = self._rules_by_id.get(key[0])
+            if rule is None or now - last >= rule.cooldown_seconds:
+                del self._last_fired[key]
+        return len(expired)
+
+
+def write_alerts(path: str, alerts: List[Dict]) -> None:
+    """告警追加写入本地文件（每行一条 JSON）"""
+    with open(path, "a", encoding="utf-8") as f:
+        for alert in alerts:
+            f.write(json.dumps(alert, ensure_ascii=False) + "\n")
@@ -0,0 +1,108 @@
+# 告警规则引擎基准测试
+"""
+加载不同数量的随机规则（前缀/扩展名/精确路径/通配符，部分限定客户端），
+测量每个事件的平均评估耗时，并与逐条规则 fnmatch 的朴素实现对比
+引擎耗时只取决于路径深度和实际匹配到的规则数（"匹配数"列），与规则总数无关
+
+用法：python bench_alerts.py [--rules 100 1000 5000] [--events 20000]
+"""
+import argparse
+import fnmatch
+import random
+import time
+
+from alerts import AlertEngine, AlertRule
+
+HOSTS = [f"host-{i:02d}" for i in range(20)]
+EXTENSIONS = [".conf", ".log", ".txt", ".xlsx", ".py", ".json", ".db", ".tmp"]
+EVENT_TYPES = ["created", "modified", "deleted/moved out", "moved"]
+DIR_NAMES = 200  # 每层目录名数量
+
+
+def random_dir(rng: random.Random, depth: int) -> str:
+    return "/" + "/".join(f"d{rng.randrange(DIR_NAMES)}" for _ in range(depth))
+
+
+def make_rules(count: int, rng: random.Random):
+    rules = []
+    for i in range(count):
+        kind = rng.random()
+        if kind < 0.58:
+            pattern = random_dir(rng, rng.randint(1, 4)) + "/**"
+        elif kind < 0.6:
+            pattern = f"*{rng.choice(EXTENSIONS)}"
+        elif kind < 0.8:
+            pattern = random_dir(rng, rng.randint(2, 5)) + f"/f{rng.randrange(100)}{rng.choice(EXTENSIONS)}"
+        else:
+            pattern = random_dir(rng, rng.randint(1, 3)) + f"/*/f{rng.randrange(10)}*"
+        rules.append(AlertRule(
+            id=f"rule-{i}",
+            pattern=pattern,
+            host=rng.choice(HOSTS) if rng.random() < 0.5 else None,
+            event_types=(rng.choice(EVENT_TYPES).split("/")[0],) if rng.random() < 0.5 else (),
+            min_count=rng.choice([1, 10, 100, 500]),
+            window_seconds=rng.choice([10, 60, 300])
+        ))
+    return rules
+
+
+def make_events(count: int, rng: random.Random):
+    return [
+        {
+            "host": rng.choice(HOSTS),
+            "path": random_dir(rng, rng.randint(2, 6)) + f"/f{rng.randrange(100)}{rng.choice(EXTENSIONS)}",
+            "event_type": rng.choice(EVENT_TYPES),
+            "dest_path": None
+        }
+        for _ in range(count)
+    ]
+
+
+def naive_match(rules, path: str) -> int:
+    """对照：逐条规则 fnmatch（规则数越多越慢）"""
+    matched = 0
+    for rule in rules:
+        # fnmatch 的 * 可跨越目录，"/dir/**" 等价于 "/dir/*"
+        pattern = rule.pattern[:-1] if rule.pattern.endswith("/**") else rule.pattern
+        if fnmatch.fnmatchcase(path, pattern):
+            matched += 1
+    return matched
+
+
+def main():
+    parser = argparse.ArgumentParser(description="告警规则引擎基准测试")
+    parser.add_argument("--rules", type=int, nargs="+", default=[10, 100, 1000, 5000, 20000], help="规则数")
+    parser.add_argument("--events", type=int, default=20000, help="每轮事件数")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    events = make_events(args.events, rng)
+    print(f"{'规则数':>8} {'编译(ms)':>10} {'匹配数':>8} {'引擎(us/事件)':>14} {'朴素(us/事件)':>14} {'告警数':>8}")
+    for count in args.rules:
+        rules = make_rules(count, rng)
+        began = time.perf_counter()
+        engine = AlertEngine(rules)
+        compile_ms = (time.perf_counter() - began) * 1000
+
+        matched = sum(len(engine.matcher.match(event["path"])) for event in events) / len(events)
+
+        now = time.time()
+        began = time.perf_counter()
+        fired = 0
+        for i, event in enumerate(events):
+            fired += len(engine.evaluate(event, now + i * 0.001))
+        engine_us = (time.perf_counter() - began) / len(events) * 1e6
+
+        # 朴素实现按规则数线性变慢，只抽样部分事件
+        sample = events[:max(100, len(events) * 100 // max(count, 1))]
+        began = time.perf_counter()
+        for event in sample:
+            naive_match(rules, event["path"])
+        naive_us = (time.perf_counter() - began) / len(sample) * 1e6
+
+        print(f"{count:>8} {compile_ms:>10.1f} {matched:>8.2f} {engine_us:>14.2f} {naive_us:>14.2f} {fired:>8}")
+
+
+if __name__ == "__main__":
+    main()
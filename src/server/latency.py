@@ -0,0 +1,103 @@
+# 端到端延迟统计
+"""
+事件在客户端各阶段记录单调时钟时间戳（trace）：
+    observed  FileChangeHandler 收到 watchdog 回调
+    enqueued  进入 APIClient 发送队列
+    sent      APIClient 发出请求
+    sent_wall 发出时的客户端墙上时间（用于把单调时钟换算到墙上时间）
+    clock_offset 客户端估算的时钟偏差（服务端时间 - 客户端时间，来自上一次请求的往返）
+服务端补充 received（收到请求）和 stored（写入存储）时间，换算到服务端时钟后得到各阶段耗时：
+    handler_ms  observed -> enqueued
+    queue_ms    enqueued -> sent
+    network_ms  sent -> received（已做时钟偏差校正）
+    server_ms   received -> stored
+    total_ms    observed -> stored
+"""
+import math
+from collections import deque
+from typing import Deque, Dict, List, Optional, Set
+
+STAGES = ("handler_ms", "queue_ms", "network_ms", "server_ms", "total_ms")
+
+
+def compute_latency(trace: Optional[Dict], received: float, stored: float) -> Optional[Dict[str, float]]:
+    """
+    计算单个事件各阶段耗时（毫秒）
+    :param trace: 客户端 trace
+    :param received: 服务端收到请求的时间（epoch秒）
+    :param stored: 服务端写入存储的时间（epoch秒）
+    :return: 各阶段耗时，trace 不完整时返回 None
+    """
+    if not trace or not all(k in trace for k in ("observed", "sent", "sent_wall")):
+        return None
+    offset = trace.get("clock_offset") or 0.0
+    observed, sent = trace["observed"], trace["sent"]
+    enqueued = trace.get("enqueued", sent)
+
+    def to_server(mono: float) -> float:
+        """客户端单调时钟 -> 服务端墙上时间"""
+        return trace["sent_wall"] + (mono - sent) + offset
+
+    return {
+        "handler_ms": round((enqueued - observed) * 1000, 3),
+        "queue_ms": round((sent - enqueued) * 1000, 3),
+        "network_ms": round((received - to_server(sent)) * 1000, 3),
+        "server_ms": round((stored - received) * 1000, 3),
+        "total_ms": round((stored - to_server(observed)) * 1000, 3),
+    }
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """已排序数据的百分位（最近秩）"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class LatencyTracker:
+    """
+    按客户端保留最近 window 个事件的各阶段耗时
+    统计结果缓存：只有收到新样本的客户端在下次 summary() 时重新排序，所有调用方共用同一份结果
+    """
+
+    def __init__(self, window: int = 1000):
+        self.window = window
+        self._samples: Dict[str, Dict[str, Deque[float]]] = {}
+        self._last: Dict[str, Dict[str, float]] = {}
+        self._stats: Dict[str, Dict] = {}  # 缓存的统计结果（只读，更新时整体替换）
+        self._dirty: Set[str] = set()      # 有新样本、统计需要重算的客户端
+
+    def record(self, host: str, latency: Dict[str, float]) -> None:
+        samples = self._samples.get(host)
+        if samples is None:
+            samples = self._samples[host] = {stage: deque(maxlen=self.window) for stage in STAGES}
+        for stage in STAGES:
+            samples[stage].append(latency[stage])
+        self._last[host] = latency
+        self._dirty.add(host)
+
+    def _host_stats(self, host: str) -> Dict:
+        samples = self._samples[host]
+        stats = {"lag_ms": self._last[host]["total_ms"], "samples": len(samples["total_ms"])}
+        for stage in STAGES:
+            values = sorted(samples[stage])
+            stats[stage] = {
+                "p50": percentile(values, 50),
+                "p90": percentile(values, 90),
+                "p99": percentile(values, 99),
+            }
+        return stats
+
+    def summary(self) -> Dict[str, Dict]:
+        """
+        各客户端延迟统计（缓存的结果，调用方不能修改）
+        {host: {"lag_ms": 最近一条事件的端到端延迟, "samples": n, "total_ms": {"p50", "p90", "p99"}, ...}}
+        """
+        if self._dirty:
+            stats = dict(self._stats)
+            for host in self._dirty:
+                stats[host] = self._host_stats(host)
+            self._dirty.clear()
+            self._stats = stats
+        return self._stats
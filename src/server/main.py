@@ -1,14 +1,14 @@
 # 服务器代码
-from fastapi import FastAPI, Security, HTTPException, Request
+from fastapi import FastAPI, Security, HTTPException, Request, WebSocket, WebSocketDisconnect, Query
 from fastapi.security import APIKeyHeader
 from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, ValidationError
 import uvicorn
 from datetime import datetime, timedelta
 import logging
 
-from typing import Dict, List, Deque
-from collections import deque
+from typing import Dict, Iterator, List
 import time
 import asyncio
 import uuid
@@ -22,12 +22,47 @@ import os
 from fastapi import FastAPI, Request
 from fastapi.exceptions import RequestValidationError
 from fastapi.responses import JSONResponse
-
-# ---------- 全局状态存储 # 简单存储（实际应使用数据库）----------
-events_db: Deque[Dict] = deque(maxlen=50)  # 保留最近50条事件
-client_status: Dict[str, Dict] = {}  # 客户端状态存储 # 结构：{'client_id': {last_heartbeat:datetime,now(), 'ip':[ip]}}
-client_status2: Dict[str, Dict] = {}  # 结构：{client_id: {online, last_seen, ip, hostname}}
-clients_lock = asyncio.Lock()  # 异步锁保证线程安全
+# -------------------限流---------------------------
+from rate_limiter import RateLimiter, rate_limit_headers
+# -------------------状态存储与 worker 间通知---------------------------
+from state_store import MemoryStateStore, SqliteStateStore
+from pubsub import LocalPubSub, UnixSocketPubSub
+# -------------------轮询接口快照缓存---------------------------
+from fastapi.responses import Response
+from snapshot import SnapshotCache
+# -------------------路径前缀索引---------------------------
+from path_index import PathIndex
+# -------------------端到端延迟---------------------------
+from latency import LatencyTracker, compute_latency
+# -------------------告警规则---------------------------
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from alerts import AlertEngine, load_rules, write_alerts
+# -------------------事件导出---------------------------
+import csv
+import io
+import zlib
+
+# ---------- 运行模式（环境变量，多 worker 时各 worker 进程继承同样的设置）----------
+SERVER_WORKERS = int(os.environ.get("FILEWATCH_WORKERS", "1"))  # worker 进程数
+# 共享状态数据库；单 worker 默认使用内存，多 worker 必须使用共享文件
+STATE_DB = os.environ.get("FILEWATCH_STATE_DB") or ("filewatch_state.db" if SERVER_WORKERS > 1 else "")
+PUBSUB_SOCKET = os.environ.get("FILEWATCH_PUBSUB_SOCKET", "/tmp/filewatch_pubsub.sock")  # worker 间广播
+ALERT_RULES_FILE = os.environ.get("FILEWATCH_ALERT_RULES", "alert_rules.json")  # 告警规则
+ALERT_LOG_FILE = os.environ.get("FILEWATCH_ALERT_LOG", "alerts.ndjson")         # 告警记录（每行一条 JSON）
+HISTORY_DAYS = float(os.environ.get("FILEWATCH_HISTORY_DAYS", "7"))            # 历史事件保留天数（导出用）
+
+# ---------- 全局状态存储 ----------
+# 事件：最近50条用于仪表盘，历史按接收时间保留 HISTORY_DAYS 天；客户端状态结构：{client_id: {last_heartbeat, ip, hostname}}
+store = (
+    SqliteStateStore(STATE_DB, max_events=50, retention_seconds=HISTORY_DAYS * 86400) if STATE_DB
+    else MemoryStateStore(max_events=50, retention_seconds=HISTORY_DAYS * 86400)
+)
+MAX_BATCH_EVENTS = 500  # 单个批量请求的事件上限
+# 一条 ingest 广播最多携带一整批事件（每条按 32 KiB 估算，含 meta/trace/序号/延迟）
+PUBSUB_LINE_LIMIT = MAX_BATCH_EVENTS * 32 * 1024
+# 心跳/事件到达通知（多 worker 时跨进程广播，SSE 据此立即推送）
+pubsub = UnixSocketPubSub(PUBSUB_SOCKET, line_limit=PUBSUB_LINE_LIMIT) if SERVER_WORKERS > 1 else LocalPubSub()
 last_data_update = time.time()  # 最后数据更新时间戳
 
 # ---------- 日志配置 ----------
@@ -46,6 +81,23 @@ app = FastAPI(title="File Monitor Server")
 API_KEY = "your-secret-key-123"
 api_key_header = APIKeyHeader(name="X-API-Key")
 HEARTBEAT_TIMEOUT = 90  # 从配置读取，此处简化为常量
+# 限流配置：每个客户端桶容量（允许突发）与每秒补充速率
+RATE_LIMIT_CAPACITY = 200
+RATE_LIMIT_REFILL_PER_SEC = 50
+PATH_INDEX_MAX_NODES = 200000  # 路径索引节点上限（超出后删除最久未变化的叶子）
+PATH_INDEX_HALF_LIFE = 600     # 目录热度半衰期（秒）
+LATENCY_WARN_MS = 5000         # 端到端延迟超过该值时记录警告
+LATENCY_WARN_INTERVAL = 10     # 同一客户端的延迟警告最短间隔（秒）
+STREAM_AUTH_TIMEOUT = 10       # 长连接建立后等待认证帧的时间（秒）
+RECENT_ALERTS = 50             # 仪表盘保留的最近告警数
+EXPORT_CHUNK_SIZE = 1000       # 导出时每次从存储读取并编码的事件数
+EXPORT_CSV_FIELDS = ["received_at", "host", "event_type", "timestamp", "path", "dest_path",
+                     "seq", "size", "mtime", "inode", "owner"]
+# 每个 worker 各自限流，请求大致均匀分布到各 worker，因此按 worker 数平分额度
+rate_limiter = RateLimiter(
+    max(1, RATE_LIMIT_CAPACITY // SERVER_WORKERS),
+    RATE_LIMIT_REFILL_PER_SEC / SERVER_WORKERS
+)
 # ---------- Web界面相关 ----------
 
 # 挂载静态文件和模板 正确挂载静态文件（关键修改点）
@@ -75,29 +127,78 @@ def get_recent_events() -> List[Dict]:
             "host": event["host"],
             "path": event["path"],
             "event_type": event["event_type"],
-            "timestamp": event["timestamp"]
+            "timestamp": event["timestamp"],
+            "meta": event.get("meta")
         }
-        for event in reversed(events_db)  # 最新事件在前
+        for event in reversed(store.recent_events())  # 最新事件在前
     ]
 
 
-def get_client_status() -> Dict[str, Dict]:
+def is_online(last_heartbeat: str, now: datetime) -> bool:
+    """最后一次心跳是否在超时阈值内"""
+    return (now - datetime.fromisoformat(last_heartbeat)).total_seconds() < HEARTBEAT_TIMEOUT
+
+
+def get_client_status(clients: Dict[str, Dict] = None) -> Dict[str, Dict]:
     """获取客户端在线状态"""
     status = {}
     now = datetime.now()
 
-    for client_id, info in client_status.items():
+    if clients is None:
+        clients = store.clients()
+    for client_id, info in clients.items():
         last_heartbeat = info["last_heartbeat"]  # 上一次时间
-        offline_seconds = (now - last_heartbeat).total_seconds()
 
         status[client_id] = {
-            "online": offline_seconds < HEARTBEAT_TIMEOUT,
-            "last_heartbeat": last_heartbeat.isoformat(),
+            "online": is_online(last_heartbeat, now),
+            "last_heartbeat": last_heartbeat,
             "ip": info["ip"]
         }
     return status
 
 
+def next_offline_time(clients: Dict[str, Dict]) -> float | None:
+    """最早会有在线客户端因心跳超时变为离线的时间（epoch秒），没有则返回 None"""
+    now = time.time()
+    deadlines = [
+        datetime.fromisoformat(info["last_heartbeat"]).timestamp() + HEARTBEAT_TIMEOUT
+        for info in clients.values()
+    ]
+    upcoming = [t for t in deadlines if t > now]
+    return min(upcoming) if upcoming else None
+
+
+def build_clients_snapshot():
+    """快照：客户端状态（/api/data, /api/events/status）"""
+    clients = store.clients()
+    return get_client_status(clients), next_offline_time(clients)
+
+
+def build_status_snapshot():
+    """快照：客户端状态 + 最近事件（/api/status）"""
+    clients = store.clients()
+    data = {
+        "clients": get_client_status(clients),
+        "recent_events": get_recent_events()
+    }
+    return data, next_offline_time(clients)
+
+
+# 每次状态变化只重新生成一次预编码 JSON，所有轮询请求共用
+snapshots = SnapshotCache(store.version)
+snapshots.register("clients", build_clients_snapshot)
+snapshots.register("status", build_status_snapshot)
+
+
+async def snapshot_response(request: Request, name: str) -> Response:
+    """返回快照，If-None-Match 命中时返回 304（快照过期时在线程池中查询存储重新生成）"""
+    snapshot = await run_in_threadpool(snapshots.get, name)
+    headers = {"ETag": snapshot.etag, "Cache-Control": "no-cache"}
+    if snapshot.matches(request.headers.get("if-none-match")):
+        return Response(status_code=304, headers=headers)
+    return Response(content=snapshot.body, media_type="application/json", headers=headers)
+
+
 class HeartbeatData(BaseModel):
     """
     心跳数据
@@ -112,6 +213,194 @@ class FileEvent(BaseModel):
     timestamp: str  # ISO 格式时间戳
     path: str  # 文件路径
     dest_path: str | None = None  # 允许 None
+    meta: Dict | None = None  # 文件元数据 {size, mtime, inode, owner, truncated}，删除事件为 None
+    trace: Dict | None = None  # 客户端各阶段单调时钟时间戳 {observed, enqueued, sent, sent_wall, clock_offset}
+    seq: int | None = None  # 客户端事件序号（单调递增，用于去重和缺口检测）
+    seq_epoch: str | None = None  # 序号空间标识（客户端序号状态重建后变化）
+
+
+class EventBatch(BaseModel):
+    """批量上报的事件（同一客户端）"""
+    host: str  # 客户端主机标识（限流的key）
+    events: List[FileEvent]
+    seq_epoch: str | None = None  # abandoned 所属的序号空间
+    abandoned: List[List[int]] | None = None  # 客户端无法补发的序号区间 [[start, end], ...]
+
+
+# 路径索引：每个 worker 都根据 ingest 通知维护一份完整索引
+path_index = PathIndex(max_nodes=PATH_INDEX_MAX_NODES, half_life=PATH_INDEX_HALF_LIFE)
+
+
+def index_events(message: Dict) -> None:
+    """ingest 通知处理：更新路径索引（本 worker 和其它 worker 收到的事件都会到这里）"""
+    if message.get("type") != "ingest":
+        return
+    now = time.time()
+    for event in message["events"]:
+        path_index.add(event["host"], event["path"], event["event_type"], now)
+        if event.get("dest_path"):
+            path_index.add(event["host"], event["dest_path"], event["event_type"], now)
+
+
+pubsub.add_handler(index_events)
+
+# 延迟统计：同样由 ingest 通知驱动，每个 worker 都能看到所有客户端
+latency_tracker = LatencyTracker()
+last_latency_warning: Dict[str, float] = {}  # host -> 上次警告时间
+
+
+def track_latency(message: Dict) -> None:
+    """ingest 通知处理：记录各事件的阶段耗时"""
+    if message.get("type") != "ingest":
+        return
+    for event, latency in zip(message["events"], message.get("latency") or []):
+        if latency is not None:
+            latency_tracker.record(event["host"], latency)
+
+
+pubsub.add_handler(track_latency)
+
+
+# 告警：只在 leader 上评估（它能看到所有 worker 的事件，且避免重复告警），触发后广播给所有 worker
+alert_engine = AlertEngine(load_rules(ALERT_RULES_FILE))
+recent_alerts = deque(maxlen=RECENT_ALERTS)
+pending_publishes = set()  # 处理函数中发起的广播任务（保留引用直到完成）
+alert_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="AlertWriter")  # 单线程：告警按触发顺序写入
+
+
+def log_alert_write(future) -> None:
+    """告警文件写入完成回调"""
+    if future.exception() is not None:
+        logger.error(f"告警写入文件失败: {ALERT_LOG_FILE}", exc_info=future.exception())
+
+
+def evaluate_alerts(message: Dict) -> None:
+    """ingest 通知处理：评估告警规则，触发的告警写入告警文件并广播"""
+    if message.get("type") != "ingest" or not pubsub.is_leader or not alert_engine.rules:
+        return
+    fired = alert_engine.evaluate_events(message["events"], time.time())
+    if not fired:
+        return
+    for alert in fired:
+        logger.warning(
+            f"告警 [{alert['rule_id']}] 客户端 {alert['host']}: "
+            f"{alert['window_seconds']:.0f} 秒内 {alert['count']} 次 {alert['event_type']}，路径={alert['path']}"
+        )
+    # 文件写入放到线程池，不阻塞事件循环上的 ingest 处理
+    loop = asyncio.get_running_loop()
+    loop.run_in_executor(alert_writer, write_alerts, ALERT_LOG_FILE, fired).add_done_callback(log_alert_write)
+    task = loop.create_task(pubsub.publish({"type": "alert", "alerts": fired}))
+    pending_publishes.add(task)
+    task.add_done_callback(pending_publishes.discard)
+
+
+def collect_alerts(message: Dict) -> None:
+    """alert 通知处理：保存最近告警（SSE 推送）"""
+    if message.get("type") == "alert":
+        recent_alerts.extend(message["alerts"])
+
+
+pubsub.add_handler(evaluate_alerts)
+pubsub.add_handler(collect_alerts)
+
+
+def check_latency(host: str, path: str, latency: Dict[str, float]) -> None:
+    """延迟超过阈值时记录警告（同一客户端限频）"""
+    if latency["total_ms"] <= LATENCY_WARN_MS:
+        return
+    now = time.time()
+    if now - last_latency_warning.get(host, 0) < LATENCY_WARN_INTERVAL:
+        return
+    last_latency_warning[host] = now
+    logger.warning(
+        f"客户端 {host} 事件延迟过高: 总计 {latency['total_ms']:.0f}ms "
+        f"(处理 {latency['handler_ms']:.0f} / 排队 {latency['queue_ms']:.0f} / "
+        f"网络 {latency['network_ms']:.0f} / 服务端 {latency['server_ms']:.0f}) 路径={path}"
+    )
+
+
+async def store_events(events: List[FileEvent], received: float) -> int:
+    """
+    存储事件（自动维护队列长度），并通知所有 worker
+    :param events: 事件
+    :param received: 收到请求的时间（epoch秒），用于计算延迟
+    :return: 重复（已存储过）的事件数
+    """
+    records = [
+        {
+            "host": event.host,
+            "path": event.path,
+            "event_type": event.event_type,
+            "timestamp": event.timestamp,
+            "dest_path": event.dest_path,
+            "meta": event.meta,
+            "seq": event.seq,
+            "seq_epoch": event.seq_epoch,
+            "received_at": received
+        }
+        for event in events
+    ]
+    if not records:
+        return 0
+    # 存储调用是同步的（SQLite 写锁最多等待 10 秒），放到线程池中执行，不阻塞事件循环
+    fresh = await run_in_threadpool(store.add_events, records)
+    stored = time.time()
+    # 重复事件（客户端重试/补发）不再通知
+    events = [event for event, ok in zip(events, fresh) if ok]
+    records = [record for record, ok in zip(records, fresh) if ok]
+    duplicates = len(fresh) - len(records)
+    if duplicates:
+        logger.info(f"忽略 {duplicates} 条重复事件（按序号去重）")
+    if not records:
+        return duplicates
+    latencies = [compute_latency(event.trace, received, stored) for event in events]
+    for event, latency in zip(events, latencies):
+        if latency is not None:
+            check_latency(event.host, event.path, latency)
+    await pubsub.publish({"type": "ingest", "events": records, "latency": latencies})
+    return duplicates
+
+
+async def missing_ranges(host: str) -> List[List[int]]:
+    """客户端当前缺失的序号区间（返回给客户端，从本地缓存补发）"""
+    state = await run_in_threadpool(store.sequence_state, host)
+    return state["gaps"][:20] if state else []
+
+
+async def accept_batch(batch: EventBatch, received: float) -> Dict:
+    """
+    按令牌数接收前 accepted 条事件（HTTP 批量接口与长连接共用）
+    :return: 响应体，令牌耗尽时 status 为 rate_limited
+    """
+    if batch.abandoned and batch.seq_epoch:
+        await run_in_threadpool(store.abandon_sequences, batch.host, batch.seq_epoch, batch.abandoned)
+        logger.info(f"客户端 {batch.host} 声明无法补发的序号: {batch.abandoned[:5]}")
+
+    granted, budget = rate_limiter.acquire(batch.host, len(batch.events))
+    if not granted and batch.events:
+        logger.warning(f"客户端 {batch.host} 超出限流，批量 {len(batch.events)} 条被拒绝")
+        return {"status": "rate_limited", "accepted": 0, "rate_limit": budget, "server_time": time.time()}
+
+    duplicates = await store_events(batch.events[:granted], received)
+    logger.info(f"收到来自 {batch.host} 的批量事件: 接收 {granted}/{len(batch.events)} 条")
+    return {"status": "success", "accepted": granted, "rate_limit": budget, "server_time": time.time(),
+            "duplicates": duplicates, "missing": await missing_ranges(batch.host)}
+
+
+async def record_heartbeat(client_id: str, ip: str) -> None:
+    """记录客户端心跳并通知所有 worker（HTTP 心跳接口与长连接 ping 共用）"""
+    await run_in_threadpool(store.update_client, client_id, ip)
+    await pubsub.publish({"type": "heartbeat", "client_id": client_id})
+    logger.info(f"收到来自 {client_id} 的心跳")
+
+
+def rate_limited_response(budget: Dict) -> JSONResponse:
+    """令牌耗尽时返回429，附带预算供客户端退避"""
+    return JSONResponse(
+        status_code=429,
+        content={"status": "rate_limited", "accepted": 0, "rate_limit": budget, "server_time": time.time()},
+        headers=rate_limit_headers(budget)
+    )
 
 
 # ---------- API端点 ----------
@@ -124,6 +413,7 @@ async def report_event(
         api_key: str = Security(api_key_header)
 ):
     """接收并处理客户端上报事件"""
+    received = time.time()
     client_ip = request.client.host  # 获取客户端IP
 
     """接收客户端上报的文件事件"""
@@ -131,19 +421,18 @@ async def report_event(
         logger.warning(f"认证失败！客户端IP: {client_ip}，使用的Key: {api_key}")
         raise HTTPException(status_code=401, detail="Invalid API Key")
 
+    granted, budget = rate_limiter.acquire(event.host)
+    if not granted:
+        logger.warning(f"客户端 {event.host} 超出限流，丢弃事件: {event.path}")
+        return rate_limited_response(budget)
+
     # 记录接收的事件
     logger.info(
         f"收到来自 {event.host} 的事件: ,时间:{event.timestamp}"
         f"类型={event.event_type}, 路径={event.path}"
     )
 
-    # 存储事件（自动维护队列长度）
-    events_db.append({
-        "host": event.host,
-        "path": event.path,
-        "event_type": event.event_type,
-        "timestamp": event.timestamp
-    })
+    duplicates = await store_events([event], received)
 
     # # 添加时间戳和服务端记录时间
     # server_timestamp = datetime.now().isoformat()
@@ -152,7 +441,35 @@ async def report_event(
     # event_data["server_time"] = server_timestamp
     #
     # events_db.append(event_data)
-    return {"status": "success"}
+    return JSONResponse(
+        content={"status": "success", "rate_limit": budget, "server_time": time.time(),
+                 "duplicates": duplicates, "missing": await missing_ranges(event.host)},
+        headers=rate_limit_headers(budget)
+    )
+
+
+@app.post("/api/events/batch")
+async def report_event_batch(
+        batch: EventBatch,
+        request: Request,
+        api_key: str = Security(api_key_header)
+):
+    """
+    批量接收客户端事件
+    按令牌数接收前 accepted 条，其余由客户端重新排队后再发
+    """
+    received = time.time()
+    client_ip = request.client.host
+    if api_key != API_KEY:
+        logger.warning(f"认证失败！客户端IP: {client_ip}，使用的Key: {api_key}")
+        raise HTTPException(status_code=401, detail="Invalid API Key")
+    if len(batch.events) > MAX_BATCH_EVENTS:
+        raise HTTPException(status_code=413, detail=f"单批事件数不能超过 {MAX_BATCH_EVENTS}")
+
+    body = await accept_batch(batch, received)
+    if body["status"] == "rate_limited":
+        return rate_limited_response(body["rate_limit"])
+    return JSONResponse(content=body, headers=rate_limit_headers(body["rate_limit"]))
 
 
 # 心跳检测 报告
@@ -167,41 +484,241 @@ async def report_heartbeat(
     if api_key != API_KEY:
         raise HTTPException(status_code=401, detail="Invalid API Key")
 
-    async with clients_lock:
-        # 更新状态
-        client_status[data.client_id] = {
-            "last_heartbeat": datetime.now().isoformat(),
-            "ip": request.client.host
-        }
-        client_status2[data.client_id]={
-            "online":True,
-            "last_seen":datetime.now().isoformat(),
-            "ip":request.client.host,
-            "hostname":data.client_id
-        }
-    logger.info(f"收到来自 {data.client_id} 的心跳")
+    # 更新状态
+    await record_heartbeat(data.client_id, request.client.host)
     return {"status": "alive"}
 
 
+# ---------- 客户端长连接（可选，替代逐个 HTTP 请求）----------
+async def send_resume(websocket: WebSocket, host: str, delay: float) -> None:
+    """限流暂停 delay 秒后通知客户端恢复发送"""
+    await asyncio.sleep(delay)
+    try:
+        await websocket.send_json({"type": "flow", "action": "resume", "rate_limit": rate_limiter.budget(host)})
+    except (WebSocketDisconnect, RuntimeError):
+        pass  # 连接已关闭
+
+
+@app.websocket("/api/stream")
+async def client_stream(websocket: WebSocket):
+    """
+    客户端长连接：认证一次，之后事件和心跳都走同一个连接
+    客户端 -> 服务端（JSON 文本帧）：
+        {"type": "auth", "api_key", "client_id"}           连接后的第一帧
+        {"type": "events", "id", "host", "events": [...]}  批量事件，格式同 /api/events/batch
+        {"type": "ping", "id", "client_id"}                心跳
+    服务端 -> 客户端：
+        {"type": "auth_ok", "server_time"}
+        {"type": "ack", "id", ...}                         响应体同 /api/events/batch（含 rate_limit、missing）
+        {"type": "pong", "id", "server_time"}
+        {"type": "flow", "action": "pause"/"resume", "rate_limit"}  限流时暂停，令牌回补后通知恢复
+        {"type": "error", "id", "detail"}
+    认证失败关闭码 4401；HEARTBEAT_TIMEOUT 内没有任何帧时关闭连接
+    """
+    await websocket.accept()
+    client_ip = websocket.client.host if websocket.client else ""
+    try:
+        auth = json.loads(await asyncio.wait_for(websocket.receive_text(), timeout=STREAM_AUTH_TIMEOUT))
+    except (asyncio.TimeoutError, ValueError):
+        auth = None
+    except WebSocketDisconnect:
+        return
+    if not isinstance(auth, dict) or auth.get("type") != "auth" or auth.get("api_key") != API_KEY:
+        logger.warning(f"长连接认证失败！客户端IP: {client_ip}")
+        await websocket.close(code=4401)
+        return
+    client_id = auth.get("client_id") or client_ip
+    await websocket.send_json({"type": "auth_ok", "server_time": time.time()})
+    logger.info(f"客户端 {client_id} 建立长连接（IP: {client_ip}）")
+
+    resume_task = None
+    try:
+        while True:
+            text = await asyncio.wait_for(websocket.receive_text(), timeout=HEARTBEAT_TIMEOUT)
+            received = time.time()
+            try:
+                frame = json.loads(text)
+                kind = frame.get("type")
+            except (ValueError, AttributeError):
+                await websocket.send_json({"type": "error", "id": None, "detail": "帧必须是 JSON 对象"})
+                continue
+
+            if kind == "ping":
+                await record_heartbeat(frame.get("client_id") or client_id, client_ip)
+                await websocket.send_json({"type": "pong", "id": frame.get("id"), "server_time": time.time()})
+            elif kind == "events":
+                try:
+                    batch = EventBatch.model_validate(frame)
+                except ValidationError as e:
+                    await websocket.send_json({"type": "error", "id": frame.get("id"), "detail": json.loads(e.json())})
+                    continue
+                if len(batch.events) > MAX_BATCH_EVENTS:
+                    await websocket.send_json({"type": "error", "id": frame.get("id"),
+                                               "detail": f"单批事件数不能超过 {MAX_BATCH_EVENTS}"})
+                    continue
+                body = await accept_batch(batch, received)
+                await websocket.send_json({"type": "ack", "id": frame.get("id"), **body})
+                if body["status"] == "rate_limited" and (resume_task is None or resume_task.done()):
+                    await websocket.send_json({"type": "flow", "action": "pause", "rate_limit": body["rate_limit"]})
+                    resume_task = asyncio.create_task(
+                        send_resume(websocket, batch.host, body["rate_limit"]["retry_after"])
+                    )
+            else:
+                await websocket.send_json({"type": "error", "id": frame.get("id"), "detail": f"未知的帧类型: {kind}"})
+    except asyncio.TimeoutError:
+        logger.warning(f"客户端 {client_id} 长连接超过 {HEARTBEAT_TIMEOUT} 秒无数据，关闭")
+        await websocket.close(code=1001)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        if resume_task is not None:
+            resume_task.cancel()
+        logger.info(f"客户端 {client_id} 长连接已断开")
+
+
 @app.get("/api/events/status")
-async def get_clients_status():
+async def get_clients_status(request: Request):
     """获取所有客户端状态（调试用）"""
-    status = {}
-    for client_id, info in client_status.items():
-        last_time = info["last_heartbeat"]
-        offline_seconds = (datetime.now() - last_time).total_seconds()
-        status[client_id] = {
-            "online": offline_seconds < 90,  # 假设超时阈值为90秒
-            "last_heartbeat": last_time.isoformat(),
-            "ip": info["ip"]
-        }
-    return status
+    return await snapshot_response(request, "clients")
 
 
 @app.get("/api/events")
 async def get_events():
     """获取所有事件（用于调试）"""
-    return {"count": len(events_db), "events": events_db}
+    events = await run_in_threadpool(store.recent_events)
+    return {"count": len(events), "events": events}
+
+
+def export_chunks(events: Iterator[Dict], fmt: str) -> Iterator[str]:
+    """把事件编码为 NDJSON/CSV 文本，每 EXPORT_CHUNK_SIZE 条输出一块"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == "csv" else None
+    if writer:
+        writer.writerow(EXPORT_CSV_FIELDS)
+    count = 0
+    for event in events:
+        event = dict(event, received_at=datetime.fromtimestamp(event.get("received_at", 0)).isoformat())
+        if writer:
+            row = {**(event.get("meta") or {}), **event}
+            writer.writerow(["" if row.get(field) is None else row[field] for field in EXPORT_CSV_FIELDS])
+        else:
+            buffer.write(json.dumps(event, ensure_ascii=False))
+            buffer.write("\n")
+        count += 1
+        if count % EXPORT_CHUNK_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+    logger.info(f"事件导出完成: {count} 条")
+
+
+def encode_export(chunks: Iterator[str], compress: bool) -> Iterator[bytes]:
+    """UTF-8 编码，compress 时边生成边 gzip 压缩"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None  # wbits=31: gzip 格式
+    for text in chunks:
+        data = text.encode("utf-8")
+        if compressor:
+            data = compressor.compress(data)
+        if data:
+            yield data
+    if compressor:
+        yield compressor.flush()
+
+
+@app.get("/api/events/export")
+async def export_events(
+        fmt: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$"),
+        host: str | None = None,
+        start: datetime | None = None,
+        end: datetime | None = None,
+        compress: bool = Query(False, alias="gzip"),
+        api_key: str = Security(api_key_header)
+):
+    """
+    流式导出历史事件（按服务端接收时间过滤，内存占用与导出量无关）
+    :param fmt: ndjson / csv
+    :param host: 只导出该客户端
+    :param start: 接收时间下限（ISO 时间，含）
+    :param end: 接收时间上限（ISO 时间，不含；默认为请求时刻，导出期间新到的事件不包含）
+    :param compress: 是否 gzip 压缩（下载 .gz 文件）
+    """
+    if api_key != API_KEY:
+        raise HTTPException(status_code=401, detail="Invalid API Key")
+    since = start.timestamp() if start else None
+    until = end.timestamp() if end else time.time()
+    if since is not None and since >= until:
+        raise HTTPException(status_code=400, detail="start 必须早于 end")
+    logger.info(f"导出事件: 格式={fmt}, 客户端={host or '全部'}, 时间={start or '最早'} ~ {end or '现在'}, gzip={compress}")
+
+    # 同步生成器：StreamingResponse 在线程池中迭代，读存储不阻塞事件循环
+    events = store.iter_events(since=since, until=until, host=host, chunk_size=EXPORT_CHUNK_SIZE)
+    body = encode_export(export_chunks(events, fmt), compress)
+    filename = f"events-{datetime.now().strftime('%Y%m%d%H%M%S')}.{fmt}"
+    media_type = "application/x-ndjson" if fmt == "ndjson" else "text/csv; charset=utf-8"
+    if compress:
+        filename += ".gz"
+        media_type = "application/gzip"
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+@app.get("/api/hosts/{host}/gaps")
+async def get_sequence_gaps(host: str):
+    """客户端事件序号的缺口（可能丢失的事件区间）"""
+    state = await run_in_threadpool(store.sequence_state, host)
+    if state is None:
+        raise HTTPException(status_code=404, detail="未收到过该客户端带序号的事件")
+    return {
+        "host": host,
+        "epoch": state["epoch"],
+        "max_seen": state["max_seen"],
+        "missing": state["gaps"]
+    }
+
+
+@app.get("/api/alerts")
+async def get_alerts():
+    """最近触发的告警（最新的在前）"""
+    return {"rules": len(alert_engine.rules), "alerts": list(reversed(recent_alerts))}
+
+
+@app.get("/api/latency")
+async def get_latency():
+    """各客户端端到端延迟（lag 与各阶段 p50/p90/p99，单位毫秒）"""
+    return latency_tracker.summary()
+
+
+# ---------- 路径索引查询 ----------
+@app.get("/api/index/changes")
+async def get_subtree_changes(host: str, prefix: str = "", since_seconds: float = 3600, limit: int = 100):
+    """某客户端某路径前缀下最近 since_seconds 秒内变化过的路径"""
+    changes = path_index.changes(host, prefix, since=time.time() - since_seconds, limit=limit)
+    return {"host": host, "prefix": prefix, "count": len(changes), "changes": changes}
+
+
+@app.get("/api/index/hot")
+async def get_hot_directories(host: str | None = None, top: int = 10, prefix: str = ""):
+    """热度最高的 N 个目录（不指定 host 时统计所有客户端）"""
+    return {"directories": path_index.hot(host, top=top, prefix=prefix)}
+
+
+# ---------- 生命周期 ----------
+@app.on_event("startup")
+async def on_startup():
+    """连接 worker 间广播"""
+    await pubsub.start()
+    logger.info(f"worker {pubsub.worker_id} 已启动（共 {SERVER_WORKERS} 个，存储: {STATE_DB or '内存'}）")
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await pubsub.stop()
+    alert_writer.shutdown(wait=True)  # 写完已触发的告警
+    store.close()
 
 
 # -------------------错误处理---------------------------
@@ -246,30 +763,42 @@ async def dashboard(request: Request):
 # SSE 时间流端点
 async def sse_event_stream():
     """sse数据传输"""
-    while True:
-        # 深拷贝当前状态避免数据竞争
-        async with clients_lock:
-            current_clients = client_status2.copy()
-        """字典推导式中的**info是用于解包原有字典，合并到新字典中，然后后面的"online": ...会覆盖原有的online键。这里需要说明合并的顺序，后面的键会覆盖前面的，所以新的online值会替换原来的。"""
-        # 转换为可序列化格式
-        data = {
-            cid: {
-                **info,  # 解包原有字典
-                "online": info["online"] and  # 二次验证是否超时
-                          (datetime.now() - datetime.fromisoformat(info["last_seen"])).seconds < HEARTBEAT_TIMEOUT
+    # 订阅心跳/事件通知（任一 worker 收到的都会广播过来）
+    queue = pubsub.subscribe()
+    try:
+        while True:
+            # 从共享存储读取，包含所有 worker 收到的客户端
+            current_clients = await run_in_threadpool(store.clients)
+            now = datetime.now()
+            # 转换为可序列化格式
+            data = {
+                cid: {
+                    "online": is_online(info["last_heartbeat"], now),  # 按超时阈值判断是否在线
+                    "last_seen": info["last_heartbeat"],
+                    "ip": info["ip"],
+                    "hostname": info["hostname"]
+                }
+                for cid, info in current_clients.items()
             }
-            for cid, info in current_clients.items()
-        }
-        # 按照 SSE 格式生成字符串
-        time_data = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        outData={"timestamp":time_data,
-                 "clients_activeStatus":data}
-
-        json_data = json.dumps(outData)# 关键修复：用 json.dumps 生成合法 JSON
-        yield f"data: {json_data} \n\n"
-
-        # 每一秒更新一次
-        await asyncio.sleep(1)
+            # 按照 SSE 格式生成字符串
+            time_data = now.strftime("%Y-%m-%d %H:%M:%S")
+            outData={"timestamp":time_data,
+                     "clients_activeStatus":data,
+                     "latency":latency_tracker.summary(),
+                     "alerts":list(reversed(recent_alerts))}
+
+            json_data = json.dumps(outData)# 关键修复：用 json.dumps 生成合法 JSON
+            yield f"data: {json_data} \n\n"
+
+            # 有新通知时立即推送，否则每一秒更新一次
+            try:
+                await asyncio.wait_for(queue.get(), timeout=1)
+                while not queue.empty():  # 合并积压的通知
+                    queue.get_nowait()
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        pubsub.unsubscribe(queue)
 
 
 # SSE 路由
@@ -299,9 +828,9 @@ async def sse_data():
 }
 """
 @app.get("/api/data")
-async def get_latest_data():
-    """提供最新的客户端数据"""
-    return get_client_status()
+async def get_latest_data(request: Request):
+    """提供最新的客户端数据（支持 ETag/304）"""
+    return await snapshot_response(request, "clients")
 
 """示例
 {
@@ -329,14 +858,22 @@ async def get_latest_data():
 }
 """
 @app.get("/api/status")
-async def get_real_time_status():
-    """获取客户端的实时状态数据"""
-    return {
-        "clients": get_client_status(),
-        "recent_events": get_recent_events()
-    }
+async def get_real_time_status(request: Request):
+    """获取客户端的实时状态数据（支持 ETag/304）"""
+    return await snapshot_response(request, "status")
 
 
 if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="File Monitor Server")
+    parser.add_argument("--workers", type=int, default=SERVER_WORKERS, help="worker 进程数（>1 时启用共享状态）")
+    args = parser.parse_args()
+
     logger.info("服务器启动")
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)  # 启用 uvicorn 服务器运行 python 服务
+    if args.workers > 1:
+        # 通过环境变量传给各 worker 进程（worker 会重新导入本模块）
+        os.environ["FILEWATCH_WORKERS"] = str(args.workers)
+        os.environ.setdefault("FILEWATCH_STATE_DB", os.path.abspath("filewatch_state.db"))
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, workers=args.workers)  # 多 worker 不支持 reload
+    else:
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)  # 启用 uvicorn 服务器运行 python 服务
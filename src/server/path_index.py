@@ -0,0 +1,199 @@
+# 路径前缀索引
+"""
+按客户端(host)维护一棵路径前缀树，在事件入库时更新：
+    count        该节点子树内的事件总数
+    own_count    恰好落在该路径上的事件数（文件/目录本身）
+    last_change  子树内最近一次变化时间（epoch秒，用于剪枝）
+    own_change   该路径本身最近一次变化时间（changes() 按它过滤、排序和返回）
+    score        按半衰期衰减的热度（用于热门目录排行）
+查询：
+    changes()  某个前缀下最近一段时间变化过的路径（按 last_change 剪枝，不扫描冷子树）
+    hot()      热度最高的 N 个目录
+内存上限：节点数超过 max_nodes 时删除最久未变化的叶子（祖先节点的累计计数保留）
+"""
+import heapq
+import math
+import time
+from typing import Dict, List, Optional
+
+
+def split_path(path: str) -> List[str]:
+    """拆分路径，同时兼容 Windows 反斜杠"""
+    return [part for part in path.replace("\\", "/").split("/") if part]
+
+
+def _join(parts: List[str], absolute: bool) -> str:
+    joined = "/".join(parts)
+    # Windows 盘符路径（D:/...）不加前导斜杠
+    if absolute and not (parts and parts[0].endswith(":")):
+        return "/" + joined
+    return joined
+
+
+class _Node:
+    __slots__ = ("name", "parent", "children", "count", "own_count", "last_change", "own_change",
+                 "last_event_type", "score", "score_time")
+
+    def __init__(self, name: str, parent: Optional["_Node"]):
+        self.name = name
+        self.parent = parent
+        self.children: Dict[str, "_Node"] = {}
+        self.count = 0
+        self.own_count = 0
+        self.last_change = 0.0
+        self.own_change = 0.0
+        self.last_event_type: Optional[str] = None
+        self.score = 0.0
+        self.score_time = 0.0
+
+    def parts(self) -> List[str]:
+        """从根到本节点的路径分段"""
+        parts = []
+        node = self
+        while node.parent is not None:
+            parts.append(node.name)
+            node = node.parent
+        return parts[::-1]
+
+
+class PathIndex:
+    def __init__(self, max_nodes: int = 200000, half_life: float = 600.0):
+        """
+        :param max_nodes: 所有客户端合计的节点数上限
+        :param half_life: 热度半衰期（秒）
+        """
+        self.max_nodes = max_nodes
+        self.half_life = half_life
+        self._roots: Dict[str, _Node] = {}
+        self._absolute: Dict[str, bool] = {}  # host -> 路径是否以 / 开头（POSIX）
+        self.node_count = 0
+
+    def _decayed(self, node: _Node, now: float) -> float:
+        return node.score * math.pow(0.5, (now - node.score_time) / self.half_life)
+
+    def add(self, host: str, path: str, event_type: str, ts: Optional[float] = None) -> None:
+        """记录一次变化"""
+        ts = ts if ts is not None else time.time()
+        node = self._roots.get(host)
+        if node is None:
+            node = self._roots[host] = _Node("", None)
+            self._absolute[host] = path.startswith("/")
+        self._touch(node, ts)
+        for part in split_path(path):
+            child = node.children.get(part)
+            if child is None:
+                child = node.children[part] = _Node(part, node)
+                self.node_count += 1
+            node = child
+            self._touch(node, ts)
+        node.own_count += 1
+        if ts >= node.own_change:
+            node.own_change = ts
+            node.last_event_type = event_type
+        if self.node_count > self.max_nodes:
+            self.prune()
+
+    def _touch(self, node: _Node, ts: float) -> None:
+        node.count += 1
+        node.last_change = max(node.last_change, ts)
+        node.score = self._decayed(node, ts) + 1
+        node.score_time = ts
+
+    def _find(self, host: str, prefix: str) -> Optional[_Node]:
+        node = self._roots.get(host)
+        for part in split_path(prefix or ""):
+            if node is None:
+                return None
+            node = node.children.get(part)
+        return node
+
+    def changes(self, host: str, prefix: str = "", since: float = 0.0, limit: int = 100) -> List[Dict]:
+        """
+        前缀下 since 之后变化过的路径（最近的在前）
+        :param host: 客户端
+        :param prefix: 路径前缀
+        :param since: 起始时间（epoch秒）
+        :param limit: 最多返回条数
+        """
+        start = self._find(host, prefix)
+        if start is None:
+            return []
+        found = []
+        stack = [start]
+        while stack:
+            node = stack.pop()
+            if node.last_change < since:
+                continue  # 整棵子树都没有更新的变化
+            if node.own_count and node.own_change >= since:
+                found.append(node)
+            stack.extend(node.children.values())
+        newest = heapq.nlargest(limit, found, key=lambda n: n.own_change)
+        absolute = self._absolute.get(host, False)
+        return [
+            {
+                "path": _join(node.parts(), absolute),
+                "event_type": node.last_event_type,
+                "last_change": node.own_change,
+                "count": node.own_count
+            }
+            for node in newest
+        ]
+
+    def hot(self, host: Optional[str] = None, top: int = 10, prefix: str = "") -> List[Dict]:
+        """
+        热度最高的目录
+        :param host: 客户端，None 表示所有客户端
+        :param top: 返回条数
+        :param prefix: 只统计该前缀下的目录
+        """
+        now = time.time()
+        hosts = [host] if host is not None else list(self._roots)
+        candidates = []
+        for h in hosts:
+            start = self._find(h, prefix)
+            if start is None:
+                continue
+            stack = [start]
+            while stack:
+                node = stack.pop()
+                if node.children:
+                    if node.parent is not None:
+                        candidates.append((self._decayed(node, now), h, node))
+                    stack.extend(node.children.values())
+        hottest = heapq.nlargest(top, candidates, key=lambda item: item[0])
+        return [
+            {
+                "host": h,
+                "path": _join(node.parts(), self._absolute.get(h, False)),
+                "score": round(score, 3),
+                "count": node.count,
+                "last_change": node.last_change
+            }
+            for score, h, node in hottest
+        ]
+
+    def prune(self, target_ratio: float = 0.9) -> int:
+        """
+        删除最久未变化的叶子，直到节点数降到 max_nodes * target_ratio
+        :return: 删除的节点数
+        """
+        target = int(self.max_nodes * target_ratio)
+        removed = 0
+        while self.node_count > target:
+            leaves = []
+            for root in self._roots.values():
+                stack = list(root.children.values())
+                while stack:
+                    node = stack.pop()
+                    if node.children:
+                        stack.extend(node.children.values())
+                    else:
+                        leaves.append(node)
+            if not leaves:
+                break
+            excess = self.node_count - target
+            for node in heapq.nsmallest(excess, leaves, key=lambda n: n.last_change):
+                del node.parent.children[node.name]
+                self.node_count -= 1
+                removed += 1
+        return removed
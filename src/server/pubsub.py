@@ -0,0 +1,230 @@
+# worker 间通知
+"""
+本地发布/订阅：
+    LocalPubSub       单进程，消息只在本 worker 内分发
+    UnixSocketPubSub  多 worker，通过本地 Unix socket 广播到所有 worker
+
+多 worker 时由抢到文件锁的 worker 兼任 broker：
+    broker 监听 Unix socket，把任一连接发来的消息转发给其它所有连接
+    每个 worker（包括 broker 自己）作为普通连接接入
+    broker 所在 worker 退出后，其它 worker 重连时重新抢锁接任
+
+消息为一行 JSON：{"type": "ingest"/"heartbeat"/..., "origin": worker_id, ...}
+超过 line_limit 的行整行丢弃并记录警告（不断开连接）
+"""
+import asyncio
+import json
+import logging
+import os
+import uuid
+from typing import Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger("FileMonitorServer.PubSub")
+
+DEFAULT_LINE_LIMIT = 16 * 1024 * 1024  # 单条广播消息（一行）的长度上限
+
+
+async def read_line(reader: asyncio.StreamReader) -> Optional[bytes]:
+    """
+    读取一行（连接关闭时返回 b""）
+    :return: 超过 reader 长度上限的行整行丢弃，返回 None
+    """
+    oversized = False
+    while True:
+        try:
+            line = await reader.readuntil(b"\n")
+            return None if oversized else line
+        except asyncio.IncompleteReadError as e:
+            return b"" if oversized else e.partial
+        except asyncio.LimitOverrunError as e:
+            # 丢弃已缓冲的部分，继续读到行尾
+            oversized = True
+            await reader.readexactly(e.consumed)
+
+
+class LocalPubSub:
+    """进程内发布/订阅"""
+
+    def __init__(self):
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.is_leader = True  # 单进程时本 worker 即 leader
+        self._queues: Set[asyncio.Queue] = set()
+        self._handlers: List[Callable[[Dict], None]] = []
+
+    def subscribe(self, maxsize: int = 100) -> asyncio.Queue:
+        """订阅消息（如 SSE 连接），返回消息队列"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self._queues.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        self._queues.discard(queue)
+
+    def add_handler(self, handler: Callable[[Dict], None]) -> None:
+        """注册消息处理函数（本地和其它 worker 发布的消息都会调用）"""
+        self._handlers.append(handler)
+
+    def _dispatch(self, message: Dict) -> None:
+        """分发给本 worker 的处理函数和订阅者"""
+        for handler in self._handlers:
+            try:
+                handler(message)
+            except Exception:
+                logger.error(f"消息处理失败: {message.get('type')}", exc_info=True)
+        for queue in self._queues:
+            if queue.full():
+                # 订阅者消费太慢时丢弃最旧消息（SSE 只需要被唤醒）
+                queue.get_nowait()
+            queue.put_nowait(message)
+
+    async def publish(self, message: Dict) -> None:
+        """发布消息"""
+        message = {**message, "origin": self.worker_id}
+        self._dispatch(message)
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+
+class UnixSocketPubSub(LocalPubSub):
+    """基于 Unix socket 的跨 worker 发布/订阅"""
+
+    def __init__(self, socket_path: str, reconnect_delay: float = 1.0, line_limit: int = DEFAULT_LINE_LIMIT):
+        """
+        :param socket_path: Unix socket 路径（所有 worker 相同）
+        :param reconnect_delay: 断线重连间隔（秒）
+        :param line_limit: 单条消息的长度上限（字节），需能容纳一整批事件的 ingest 通知
+        """
+        super().__init__()
+        self.socket_path = socket_path
+        self.reconnect_delay = reconnect_delay
+        self.line_limit = line_limit
+        self.is_leader = False
+        self._lock_fd = None
+        self._server = None
+        self._peers: Set[asyncio.StreamWriter] = set()
+        self._writer = None
+        self._reader_task = None
+        self._stopping = False
+
+    # ---------------------- broker ----------------------
+    def _try_become_broker(self) -> bool:
+        """抢文件锁，成功的 worker 负责监听 socket"""
+        import fcntl
+        fd = os.open(f"{self.socket_path}.lock", os.O_CREAT | os.O_RDWR, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        return True
+
+    async def _start_broker(self) -> None:
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)  # 上一个 broker 遗留的 socket 文件
+        self._server = await asyncio.start_unix_server(self._handle_peer, path=self.socket_path,
+                                                       limit=self.line_limit)
+        self.is_leader = True
+        logger.info(f"worker {self.worker_id} 成为 broker: {self.socket_path}")
+
+    async def _handle_peer(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """broker：把一个连接发来的每一行转发给其它连接"""
+        self._peers.add(writer)
+        try:
+            while True:
+                line = await read_line(reader)
+                if line is None:
+                    logger.warning(f"丢弃超过 {self.line_limit} 字节的广播消息")
+                    continue
+                if not line:
+                    break
+                for peer in list(self._peers):
+                    if peer is writer:
+                        continue
+                    try:
+                        peer.write(line)
+                    except Exception:
+                        self._peers.discard(peer)
+        finally:
+            self._peers.discard(writer)
+            writer.close()
+
+    # ---------------------- worker 连接 ----------------------
+    async def _connect(self) -> None:
+        """连接 broker，连接不上时尝试自己成为 broker"""
+        while not self._stopping:
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.socket_path, limit=self.line_limit)
+                self._writer = writer
+                self._reader_task = asyncio.create_task(self._read_loop(reader))
+                return
+            except (FileNotFoundError, ConnectionRefusedError):
+                if self._server is None and self._try_become_broker():
+                    await self._start_broker()
+                    continue
+                await asyncio.sleep(self.reconnect_delay)
+
+    async def _read_loop(self, reader: asyncio.StreamReader) -> None:
+        """接收其它 worker 发布的消息"""
+        try:
+            while True:
+                line = await read_line(reader)
+                if line is None:
+                    logger.warning(f"丢弃超过 {self.line_limit} 字节的广播消息")
+                    continue
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    logger.warning("收到无法解析的广播消息")
+                    continue
+                self._dispatch(message)
+        except (ConnectionError, OSError) as e:
+            logger.warning(f"读取广播失败: {e}")
+        finally:
+            self._writer = None
+            if not self._stopping:
+                logger.warning("与 broker 的连接断开，准备重连")
+                asyncio.create_task(self._connect())
+
+    async def publish(self, message: Dict) -> None:
+        """发布消息：本地立即分发，同时广播给其它 worker"""
+        message = {**message, "origin": self.worker_id}
+        self._dispatch(message)
+        if self._writer is None:
+            logger.warning(f"broker 未连接，消息仅在本 worker 生效: {message.get('type')}")
+            return
+        data = json.dumps(message, ensure_ascii=False).encode("utf-8") + b"\n"
+        if len(data) > self.line_limit:
+            logger.error(f"广播消息 {len(data)} 字节超过上限 {self.line_limit}，仅在本 worker 生效: "
+                         f"{message.get('type')}")
+            return
+        writer = self._writer
+        try:
+            writer.write(data)
+            await writer.drain()
+        except (ConnectionError, OSError) as e:
+            # 事件已经写入存储，广播失败不能让请求失败；关闭连接后由读取任务负责重连
+            logger.warning(f"广播失败，消息仅在本 worker 生效: {message.get('type')}（{e}）")
+            if self._writer is writer:
+                self._writer = None
+            writer.close()
+
+    async def start(self) -> None:
+        await self._connect()
+
+    async def stop(self) -> None:
+        self._stopping = True
+        if self._writer is not None:
+            self._writer.close()
+        if self._server is not None:
+            self._server.close()
+            for peer in list(self._peers):
+                peer.close()
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
@@ -0,0 +1,111 @@
+# 按客户端限流
+"""
+令牌桶限流：每个 host id 一个桶，互不影响
+    capacity     桶容量（允许的突发事件数）
+    refill_rate  每秒补充的令牌数（长期平均速率）
+响应中返回机器可读的预算（rate_limit 字段），客户端据此调整批量大小和发送间隔
+"""
+import time
+from typing import Dict, Tuple, Any
+
+
+class TokenBucket:
+    """单个客户端的令牌桶"""
+    __slots__ = ("capacity", "refill_rate", "tokens", "updated")
+
+    def __init__(self, capacity: float, refill_rate: float):
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.tokens = capacity  # 初始为满桶
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        """按流逝时间补充令牌"""
+        elapsed = now - self.updated
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_rate)
+            self.updated = now
+
+    def consume(self, n: int = 1) -> int:
+        """
+        尽量消耗 n 个令牌
+        :param n: 请求的令牌数
+        :return: 实际获得的令牌数（0 ~ n）
+        """
+        self._refill(time.monotonic())
+        granted = min(n, int(self.tokens))
+        self.tokens -= granted
+        return granted
+
+    def budget(self) -> Dict[str, Any]:
+        """当前预算（机器可读）"""
+        self._refill(time.monotonic())
+        remaining = int(self.tokens)
+        retry_after = 0.0
+        if remaining < 1:
+            # 距离下一个令牌到账还需要的秒数
+            retry_after = round((1 - self.tokens) / self.refill_rate, 3)
+        return {
+            "limit": int(self.capacity),
+            "remaining": remaining,
+            "refill_per_sec": self.refill_rate,
+            "retry_after": retry_after
+        }
+
+
+class RateLimiter:
+    """按 host id 管理令牌桶"""
+
+    def __init__(self, capacity: float, refill_rate: float, max_hosts: int = 10000):
+        """
+        :param capacity: 每个客户端的桶容量
+        :param refill_rate: 每秒补充的令牌数
+        :param max_hosts: 桶数量上限，超过后清理已回满的空闲桶
+        """
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.max_hosts = max_hosts
+        self._buckets: Dict[str, TokenBucket] = {}
+
+    def _bucket(self, host: str) -> TokenBucket:
+        bucket = self._buckets.get(host)
+        if bucket is None:
+            if len(self._buckets) >= self.max_hosts:
+                self._evict_idle()
+            bucket = TokenBucket(self.capacity, self.refill_rate)
+            self._buckets[host] = bucket
+        return bucket
+
+    def _evict_idle(self) -> None:
+        """删除已经回满的桶（与新建桶等价，删除不影响限流结果）"""
+        now = time.monotonic()
+        for host in list(self._buckets):
+            bucket = self._buckets[host]
+            bucket._refill(now)
+            if bucket.tokens >= bucket.capacity:
+                del self._buckets[host]
+
+    def acquire(self, host: str, n: int = 1) -> Tuple[int, Dict[str, Any]]:
+        """
+        为客户端申请 n 个令牌
+        :return: (实际获得的令牌数, 申请后的预算)
+        """
+        bucket = self._bucket(host)
+        granted = bucket.consume(n)
+        return granted, bucket.budget()
+
+    def budget(self, host: str) -> Dict[str, Any]:
+        """查询客户端当前预算（不消耗令牌）"""
+        return self._bucket(host).budget()
+
+
+def rate_limit_headers(budget: Dict[str, Any]) -> Dict[str, str]:
+    """把预算转换为响应头"""
+    headers = {
+        "X-RateLimit-Limit": str(budget["limit"]),
+        "X-RateLimit-Remaining": str(budget["remaining"]),
+    }
+    if budget["retry_after"] > 0:
+        # Retry-After 只接受整数秒
+        headers["Retry-After"] = str(max(1, int(budget["retry_after"] + 0.999)))
+    return headers
@@ -0,0 +1,139 @@
+# 事件序号去重与缺口检测
+"""
+每个客户端一个滑动窗口：
+    max_seen  已收到的最大序号
+    bits      位图，第 i 位表示序号 max_seen - i 已收到（窗口大小 size）
+    gaps      缺失的序号区间 [[start, end], ...]（闭区间，按序排列，最多 max_gaps 段）
+客户端 epoch 变化（状态文件重建）时窗口重置
+窗口之外的旧序号：在缺口中则视为补发并接收，否则视为重复
+客户端声明无法补发的序号（abandon）从缺口中删除，不再返回给客户端
+"""
+from typing import Dict, List, Optional
+
+
+class SequenceWindow:
+    def __init__(self, size: int = 4096, max_gaps: int = 1000):
+        """
+        :param size: 窗口大小（位）
+        :param max_gaps: 保留的缺口区间数上限，超出后丢弃最旧的
+        """
+        self.size = size
+        self.max_gaps = max_gaps
+        self.epoch: Optional[str] = None
+        self.max_seen = 0
+        self.bits = 0
+        self.gaps: List[List[int]] = []
+
+    def _reset(self, epoch: str) -> None:
+        self.epoch = epoch
+        self.max_seen = 0
+        self.bits = 0
+        self.gaps = []
+
+    def _add_gap(self, start: int, end: int) -> None:
+        self.gaps.append([start, end])
+        if len(self.gaps) > self.max_gaps:
+            del self.gaps[0]
+
+    def _remove_gaps(self, start: int, end: int) -> None:
+        """从缺口中删除区间 [start, end]"""
+        remaining = []
+        for gap_start, gap_end in self.gaps:
+            if gap_end < start or gap_start > end:
+                remaining.append([gap_start, gap_end])
+                continue
+            if gap_start < start:
+                remaining.append([gap_start, start - 1])
+            if gap_end > end:
+                remaining.append([end + 1, gap_end])
+        self.gaps = remaining
+
+    def _fill_gap(self, seq: int) -> bool:
+        """从缺口中移除 seq，返回 seq 是否在缺口中"""
+        for i, (start, end) in enumerate(self.gaps):
+            if start <= seq <= end:
+                pieces = []
+                if start < seq:
+                    pieces.append([start, seq - 1])
+                if seq < end:
+                    pieces.append([seq + 1, end])
+                self.gaps[i:i + 1] = pieces
+                return True
+            if start > seq:
+                break
+        return False
+
+    def accept(self, epoch: str, seq: int) -> bool:
+        """
+        登记一个序号
+        :return: True 表示新事件，False 表示重复
+        """
+        if epoch != self.epoch:
+            self._reset(epoch)
+
+        if seq > self.max_seen:
+            shift = seq - self.max_seen
+            if shift > 1:
+                # 新窗口从 1 开始计缺口；客户端无法补发的部分会通过 abandon 声明
+                self._add_gap(self.max_seen + 1, seq - 1)
+            if shift >= self.size:
+                self.bits = 1
+            else:
+                self.bits = ((self.bits << shift) | 1) & ((1 << self.size) - 1)
+            self.max_seen = seq
+            return True
+
+        offset = self.max_seen - seq
+        if offset < self.size:
+            mask = 1 << offset
+            if self.bits & mask:
+                return False
+            self.bits |= mask
+            self._fill_gap(seq)
+            return True
+        # 窗口之外：只接收缺口中的补发
+        return self._fill_gap(seq)
+
+    def abandon(self, epoch: str, start: int, end: int) -> None:
+        """
+        客户端声明无法补发的序号区间（缓存已丢弃，或崩溃时预留但未使用的序号）
+        区间内的缺口删除；超出 max_seen 的部分视为已处理，之后跳过它们不会产生缺口
+        """
+        if start > end:
+            return
+        if epoch != self.epoch:
+            self._reset(epoch)
+        self._remove_gaps(start, end)
+        if end <= self.max_seen:
+            return
+        low = max(start, self.max_seen + 1)
+        if low > self.max_seen + 1:
+            self._add_gap(self.max_seen + 1, low - 1)
+        shift = end - self.max_seen
+        filled = (1 << min(end - low + 1, self.size)) - 1  # 区间内的序号标记为已处理
+        if shift >= self.size:
+            self.bits = filled
+        else:
+            self.bits = ((self.bits << shift) | filled) & ((1 << self.size) - 1)
+        self.max_seen = end
+
+    def missing(self, limit: int = 20) -> List[List[int]]:
+        """最早的 limit 段缺口"""
+        return [list(gap) for gap in self.gaps[:limit]]
+
+    def to_dict(self) -> Dict:
+        return {
+            "epoch": self.epoch,
+            "max_seen": self.max_seen,
+            "bits": format(self.bits, "x"),
+            "gaps": self.gaps
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict, size: int = 4096, max_gaps: int = 1000) -> "SequenceWindow":
+        window = cls(size, max_gaps)
+        window.epoch = data["epoch"]
+        window.max_seen = data["max_seen"]
+        window.bits = int(data["bits"], 16)
+        window.gaps = data["gaps"]
+        return window
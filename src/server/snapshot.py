@@ -0,0 +1,69 @@
+# 轮询接口的快照缓存
+"""
+按状态版本缓存预编码好的 JSON 字节：
+    状态未变化时所有轮询请求直接复用同一份 bytes，不再重复构造和序列化
+    ETag 取内容摘要，客户端带 If-None-Match 时可直接回 304
+快照在两种情况下重新生成：
+    1. 存储的 version() 变化（有新事件/心跳）
+    2. 超过构造时给出的过期时间（例如某客户端即将因心跳超时变为离线）
+"""
+import hashlib
+import json
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# 构造函数返回 (数据, 过期时间epoch秒/None)
+Builder = Callable[[], Tuple[Any, Optional[float]]]
+
+
+class Snapshot:
+    """一份预编码的快照"""
+    __slots__ = ("body", "etag", "version", "expires_at")
+
+    def __init__(self, body: bytes, version: int, expires_at: Optional[float]):
+        self.body = body
+        self.etag = f'"{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
+        self.version = version
+        self.expires_at = expires_at
+
+    def is_fresh(self, version: int, now: float) -> bool:
+        return self.version == version and (self.expires_at is None or now < self.expires_at)
+
+    def matches(self, if_none_match: Optional[str]) -> bool:
+        """If-None-Match 是否命中当前 ETag（支持多个值、弱校验和 *）"""
+        if not if_none_match:
+            return False
+        for tag in if_none_match.split(","):
+            tag = tag.strip()
+            if tag.startswith("W/"):
+                tag = tag[2:]
+            if tag == "*" or tag == self.etag:
+                return True
+        return False
+
+
+class SnapshotCache:
+    """按名称管理快照"""
+
+    def __init__(self, version_fn: Callable[[], int]):
+        """
+        :param version_fn: 返回当前状态版本号
+        """
+        self._version_fn = version_fn
+        self._builders: Dict[str, Builder] = {}
+        self._snapshots: Dict[str, Snapshot] = {}
+
+    def register(self, name: str, builder: Builder) -> None:
+        """注册快照构造函数"""
+        self._builders[name] = builder
+
+    def get(self, name: str) -> Snapshot:
+        """获取快照，过期时重新构造"""
+        version = self._version_fn()  # 先取版本：构造期间有新写入时下次会重新构造
+        snapshot = self._snapshots.get(name)
+        if snapshot is None or not snapshot.is_fresh(version, time.time()):
+            data, expires_at = self._builders[name]()
+            body = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            snapshot = Snapshot(body, version, expires_at)
+            self._snapshots[name] = snapshot
+        return snapshot
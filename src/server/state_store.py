@@ -0,0 +1,341 @@
+# 服务端状态存储
+"""
+两种实现，接口一致：
+    MemoryStateStore  进程内存（单 worker，默认）
+    SqliteStateStore  本地 SQLite 文件（WAL 模式），多个 worker 进程共享同一份状态
+
+客户端状态结构：{client_id: {"last_heartbeat": ISO时间字符串, "ip": ip, "hostname": client_id}}
+事件结构：{"host", "path", "event_type", "timestamp", "received_at", "seq", "seq_epoch", ...}
+version() 在每次状态变化后递增，用于判断是否需要重新生成数据
+带 seq 的事件按客户端序号去重（SequenceWindow），去重与写入在同一事务中完成
+历史事件按服务端接收时间（received_at，epoch秒）保留 retention_seconds，iter_events() 分块遍历（导出用）
+"""
+import json
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Dict, Iterator, List, Deque, Optional
+
+from sequence_window import SequenceWindow
+
+
+class MemoryStateStore:
+    """进程内存存储"""
+
+    def __init__(self, max_events: int = 50, retention_seconds: float = 7 * 86400, max_history: int = 100000):
+        """
+        :param max_events: 保留的最近事件数
+        :param retention_seconds: 历史事件保留时长（秒）
+        :param max_history: 历史事件数上限（内存存储额外限制条数）
+        """
+        self._events: Deque[Dict] = deque(maxlen=max_events)
+        self.retention_seconds = retention_seconds
+        self.max_history = max_history
+        self._history: List[Dict] = []  # 按接收顺序
+        self._history_base = 0          # _history[0] 的全局编号（遍历时用编号续读）
+        self._clients: Dict[str, Dict] = {}
+        self._windows: Dict[str, SequenceWindow] = {}  # host -> 序号窗口
+        self._version = 0
+        self._lock = threading.Lock()
+
+    def add_events(self, events: List[Dict]) -> List[bool]:
+        """
+        追加事件（自动维护队列长度），重复序号的事件不写入
+        :return: 每个事件是否为新事件
+        """
+        with self._lock:
+            fresh = [_accept(self._windows, event) for event in events]
+            new_events = [event for event, ok in zip(events, fresh) if ok]
+            if new_events:
+                self._events.extend(new_events)
+                self._history.extend(new_events)
+                self._trim_history()
+                self._version += 1
+        return fresh
+
+    def _trim_history(self) -> None:
+        """删除过期和超出条数上限的历史事件（超出 10% 后批量删除，分摊开销）"""
+        cutoff = time.time() - self.retention_seconds
+        expired = 0
+        while expired < len(self._history) and self._history[expired].get("received_at", 0) < cutoff:
+            expired += 1
+        excess = max(expired, len(self._history) - self.max_history)
+        if expired or excess > self.max_history // 10:
+            del self._history[:excess]
+            self._history_base += excess
+
+    def iter_events(self, since: Optional[float] = None, until: Optional[float] = None,
+                    host: Optional[str] = None, chunk_size: int = 1000) -> Iterator[Dict]:
+        """
+        按接收顺序遍历历史事件（每次只在锁内取一块，不复制整个历史）
+        :param since: 接收时间下限（含）
+        :param until: 接收时间上限（不含）
+        :param host: 只返回该客户端的事件
+        :param chunk_size: 每块事件数
+        """
+        with self._lock:
+            position = self._history_base
+            end = self._history_base + len(self._history)  # 遍历期间新到的事件不导出
+        while position < end:
+            with self._lock:
+                position = max(position, self._history_base)  # 遍历期间被清理的事件跳过
+                start = position - self._history_base
+                chunk = self._history[start:start + min(chunk_size, end - position)]
+            position += len(chunk)
+            if not chunk:
+                return
+            for event in chunk:
+                if _matches(event, since, until, host):
+                    yield event
+
+    def abandon_sequences(self, host: str, epoch: str, ranges: List[List[int]]) -> None:
+        """客户端声明无法补发的序号区间（不再作为缺口返回）"""
+        with self._lock:
+            window = self._windows.get(host)
+            if window is None:
+                window = self._windows[host] = SequenceWindow()
+            for start, end in ranges:
+                window.abandon(epoch, start, end)
+
+    def sequence_state(self, host: str) -> Dict | None:
+        """客户端序号窗口状态（含缺口），未知客户端返回 None"""
+        with self._lock:
+            window = self._windows.get(host)
+            return window.to_dict() if window else None
+
+    def recent_events(self) -> List[Dict]:
+        """最近事件（按接收顺序，旧的在前）"""
+        with self._lock:
+            return list(self._events)
+
+    def update_client(self, client_id: str, ip: str) -> None:
+        """记录客户端心跳"""
+        with self._lock:
+            self._clients[client_id] = {
+                "last_heartbeat": datetime.now().isoformat(),
+                "ip": ip,
+                "hostname": client_id
+            }
+            self._version += 1
+
+    def clients(self) -> Dict[str, Dict]:
+        """所有客户端的心跳信息（拷贝）"""
+        with self._lock:
+            return {cid: dict(info) for cid, info in self._clients.items()}
+
+    def version(self) -> int:
+        return self._version
+
+    def close(self) -> None:
+        pass
+
+
+def _matches(event: Dict, since: Optional[float], until: Optional[float], host: Optional[str]) -> bool:
+    received_at = event.get("received_at", 0)
+    return ((since is None or received_at >= since) and (until is None or received_at < until)
+            and (host is None or event["host"] == host))
+
+
+def _accept(windows: Dict[str, SequenceWindow], event: Dict) -> bool:
+    """按客户端序号判断事件是否为新事件（没有序号的旧客户端事件一律接收）"""
+    if event.get("seq") is None:
+        return True
+    window = windows.get(event["host"])
+    if window is None:
+        window = windows[event["host"]] = SequenceWindow()
+    return window.accept(event.get("seq_epoch") or "", event["seq"])
+
+
+class SqliteStateStore:
+    """
+    SQLite 共享存储
+    每个 worker 进程各自打开一个连接，WAL 模式下读写互不阻塞
+    """
+
+    def __init__(self, db_path: str, max_events: int = 50, retention_seconds: float = 7 * 86400):
+        """
+        :param db_path: 数据库文件路径（所有 worker 相同）
+        :param max_events: 最近事件接口返回的条数
+        :param retention_seconds: 历史事件保留时长（秒）
+        """
+        self.db_path = db_path
+        self.max_events = max_events
+        self.retention_seconds = retention_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=10, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._lock:
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    host TEXT NOT NULL,
+                    data TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS clients (
+                    client_id TEXT PRIMARY KEY,
+                    ip TEXT,
+                    last_heartbeat TEXT
+                );
+                CREATE TABLE IF NOT EXISTS sequences (
+                    host TEXT PRIMARY KEY,
+                    state TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL
+                );
+                INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0);
+            """)
+            # 旧版本数据库没有 received_at 列：补上（旧事件视为已过期）
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(events)")}
+            if "received_at" not in columns:
+                self._conn.execute("ALTER TABLE events ADD COLUMN received_at REAL NOT NULL DEFAULT 0")
+            self._conn.executescript("""
+                CREATE INDEX IF NOT EXISTS idx_events_received_at ON events (received_at);
+                CREATE INDEX IF NOT EXISTS idx_events_host ON events (host, id);
+            """)
+
+    def _bump_version(self) -> None:
+        self._conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+
+    def _load_windows(self, hosts) -> Dict[str, SequenceWindow]:
+        windows = {}
+        for host in hosts:
+            row = self._conn.execute("SELECT state FROM sequences WHERE host = ?", (host,)).fetchone()
+            if row:
+                windows[host] = SequenceWindow.from_dict(json.loads(row[0]))
+        return windows
+
+    def add_events(self, events: List[Dict]) -> List[bool]:
+        """
+        追加事件，并删除超出保留数量的旧事件；重复序号的事件不写入
+        序号窗口在同一个写事务中读取和更新，多个 worker 并发收到同一事件时只有一个写入
+        :return: 每个事件是否为新事件
+        """
+        if not events:
+            return []
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                seq_hosts = {e["host"] for e in events if e.get("seq") is not None}
+                windows = self._load_windows(seq_hosts)
+                fresh = [_accept(windows, event) for event in events]
+                now = time.time()
+                rows = [
+                    (e["host"], json.dumps(e, ensure_ascii=False), e.get("received_at", now))
+                    for e, ok in zip(events, fresh) if ok
+                ]
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO sequences (host, state) VALUES (?, ?)",
+                    [(host, json.dumps(window.to_dict())) for host, window in windows.items()]
+                )
+                if rows:
+                    self._conn.executemany("INSERT INTO events (host, data, received_at) VALUES (?, ?, ?)", rows)
+                    self._conn.execute("DELETE FROM events WHERE received_at < ?", (now - self.retention_seconds,))
+                    self._bump_version()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return fresh
+
+    def iter_events(self, since: Optional[float] = None, until: Optional[float] = None,
+                    host: Optional[str] = None, chunk_size: int = 1000) -> Iterator[Dict]:
+        """
+        按接收顺序遍历历史事件（按 id 分页，每页单独查询，不长时间占用连接）
+        :param since: 接收时间下限（含）
+        :param until: 接收时间上限（不含）
+        :param host: 只返回该客户端的事件
+        :param chunk_size: 每页事件数
+        """
+        with self._lock:
+            last_id, end_id = self._conn.execute(
+                "SELECT min(id) - 1, max(id) FROM events WHERE received_at >= ?", (since or 0,)
+            ).fetchone()
+        if end_id is None:
+            return
+        conditions, params = ["id > ?", "id <= ?"], [end_id]  # 遍历期间新到的事件不导出
+        if since is not None:
+            conditions.append("received_at >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("received_at < ?")
+            params.append(until)
+        if host is not None:
+            conditions.append("host = ?")
+            params.append(host)
+        sql = f"SELECT id, data FROM events WHERE {' AND '.join(conditions)} ORDER BY id LIMIT ?"
+        while True:
+            with self._lock:
+                rows = self._conn.execute(sql, [last_id, *params, chunk_size]).fetchall()
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            for _, data in rows:
+                yield json.loads(data)
+
+    def abandon_sequences(self, host: str, epoch: str, ranges: List[List[int]]) -> None:
+        """客户端声明无法补发的序号区间（不再作为缺口返回）"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                window = self._load_windows([host]).get(host) or SequenceWindow()
+                for start, end in ranges:
+                    window.abandon(epoch, start, end)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO sequences (host, state) VALUES (?, ?)", (host, json.dumps(window.to_dict()))
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def sequence_state(self, host: str) -> Dict | None:
+        """客户端序号窗口状态（含缺口），未知客户端返回 None"""
+        with self._lock:
+            row = self._conn.execute("SELECT state FROM sequences WHERE host = ?", (host,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def recent_events(self) -> List[Dict]:
+        """最近事件（按接收顺序，旧的在前）"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT data FROM events ORDER BY id DESC LIMIT ?", (self.max_events,)
+            ).fetchall()
+        return [json.loads(row[0]) for row in reversed(rows)]
+
+    def update_client(self, client_id: str, ip: str) -> None:
+        """记录客户端心跳"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO clients (client_id, ip, last_heartbeat) VALUES (?, ?, ?)",
+                    (client_id, ip, datetime.now().isoformat())
+                )
+                self._bump_version()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def clients(self) -> Dict[str, Dict]:
+        """所有客户端的心跳信息"""
+        with self._lock:
+            rows = self._conn.execute("SELECT client_id, ip, last_heartbeat FROM clients").fetchall()
+        return {
+            cid: {"last_heartbeat": last_heartbeat, "ip": ip, "hostname": cid}
+            for cid, ip, last_heartbeat in rows
+        }
+
+    def version(self) -> int:
+        """全局版本号（任一 worker 写入都会递增）"""
+        with self._lock:
+            return self._conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
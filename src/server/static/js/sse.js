@@ -52,8 +52,62 @@ function updateData(data){
         client_container.appendChild(card);//加入标签
     });
 
+    //更新业务数据：上报延迟
+    if (data['latency']) {
+        updateLatency(data['latency']);
+    }
+
+    //更新业务数据：告警
+    if (data['alerts']) {
+        updateAlerts(data['alerts']);
+    }
 }
 
+function updateLatency(latency){
+    const tbody=document.getElementById("latency_list");
+    tbody.innerHTML="";//清空旧内容
+
+    Object.entries(latency).forEach(([host, stats]) => {
+        const total = stats.total_ms;
+        tbody.appendChild(createRow([
+            host,
+            stats.lag_ms.toFixed(0),
+            total.p50.toFixed(0),
+            total.p90.toFixed(0),
+            total.p99.toFixed(0),
+            stats.network_ms.p90.toFixed(0),
+            stats.samples
+        ]));
+    });
+}
+
+
+//生成表格行：单元格内容用 textContent 写入（路径、主机名等来自客户端上报，不能当作 HTML）
+function createRow(values){
+    const tr = document.createElement("tr");
+    values.forEach(value => {
+        const td = document.createElement("td");
+        td.textContent = value;
+        tr.appendChild(td);
+    });
+    return tr;
+}
+
+
+function updateAlerts(alerts){
+    const tbody=document.getElementById("alert_list");
+    tbody.innerHTML="";//清空旧内容
+
+    alerts.forEach(alert => {
+        tbody.appendChild(createRow([
+            new Date(alert.fired_at).toLocaleString(),
+            alert.description || alert.rule_id,
+            alert.host,
+            `${alert.count}/${alert.window_seconds}s`,
+            alert.path
+        ]));
+    });
+}
 
 
 // 确保 DOM 加载完成后执行
@@ -0,0 +1,324 @@
+"""
+大目录树的快速启动
+
+observer.schedule 会在调用线程里串行遍历整棵树注册 inotify watch，
+几十万个目录时启动需要数分钟，且可能在中途超过 max_user_watches 而失败。
+这里的启动流程：
+    1. 读取 inotify 上限（仅 Linux；其它平台递归监控只占一个句柄，跳过 2、3 步）
+    2. 并发遍历目录树，统计每个一级子目录下的目录数（同时预热目录缓存），定期输出进度
+    3. 按剩余 watch 额度规划：能放下的大目录树拆成根目录非递归监控 + 每个一级子树一个递归监控
+       （实例额度不够拆分时整棵树一个递归监控）；放不下时根目录非递归监控，
+       一级子目录从小到大依次原生监控，超出额度的子树改用增量轮询
+    4. 多个 Observer 并发注册（每个 Observer 有自己的锁），大的子树先注册，按目录数输出进度，
+       记录每个根目录的注册耗时
+拆分的根目录（包括放不下的根目录）之后新建/移入的一级子目录由根目录的监控发现，
+在后台线程中补充注册：额度够时原生监控，否则交给轮询 observer
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED, as_completed
+from typing import Dict, List, Optional, Tuple
+
+from watchdog.events import EVENT_TYPE_CREATED, EVENT_TYPE_DELETED, EVENT_TYPE_MOVED, FileSystemEventHandler
+from watchdog.observers import Observer
+
+logger = logging.getLogger("FileMonitor.Startup")
+
+INOTIFY_PROC_DIR = "/proc/sys/fs/inotify"
+WATCH_LIMIT_USAGE = 0.9  # 最多使用上限的 90%，给同一用户的其它程序留余量
+INSTANCE_RESERVE = 8     # 保留的 inotify 实例数
+SPLIT_MIN_DIRS = 1000    # 目录数达到该值的根目录拆成一级子树并发注册
+
+
+def inotify_limits() -> Tuple[Optional[int], Optional[int]]:
+    """
+    读取 inotify 上限
+    :return: (max_user_watches, max_user_instances)，非 Linux 返回 (None, None)
+    """
+    limits = []
+    for name in ("max_user_watches", "max_user_instances"):
+        try:
+            with open(os.path.join(INOTIFY_PROC_DIR, name)) as f:
+                limits.append(int(f.read().strip()))
+        except (OSError, ValueError):
+            limits.append(None)
+    return limits[0], limits[1]
+
+
+class WatchPlan:
+    """注册计划"""
+
+    def __init__(self):
+        self.native: List[Tuple[str, str, bool]] = []  # (所属根目录, 路径, 是否递归)
+        self.overflow: List[str] = []                   # 超出额度、改用轮询的子树
+        self.split: List[str] = []                      # 按一级子树监控的根目录（根目录本身非递归）
+        self.sizes: Dict[str, int] = {}                 # 原生监控路径 -> 占用的 watch 数（目录数）
+
+    def __repr__(self):
+        return f"WatchPlan(native={len(self.native)}, split={len(self.split)}, overflow={len(self.overflow)})"
+
+
+class _TopLevelHandler(FileSystemEventHandler):
+    """拆分的根目录（非递归监控）：转发事件，一级子目录新建/移入/删除/移出时增删对应的子树监控"""
+
+    def __init__(self, startup: "WatchStartup", root: str, event_handler):
+        self.startup = startup
+        self.root = root
+        self.event_handler = event_handler
+
+    def dispatch(self, event) -> None:
+        self.event_handler.dispatch(event)
+        if not event.is_directory:
+            return
+        if event.event_type in (EVENT_TYPE_DELETED, EVENT_TYPE_MOVED):
+            self.startup.release(event.src_path)
+        if event.event_type == EVENT_TYPE_CREATED:
+            self.startup.adopt(self.root, event.src_path)
+        elif event.event_type == EVENT_TYPE_MOVED:
+            self.startup.adopt(self.root, event.dest_path)
+
+
+class WatchStartup:
+    def __init__(self, workers: int = 8, progress_interval: float = 5.0):
+        """
+        :param workers: 并发遍历/注册的线程数
+        :param progress_interval: 进度日志间隔（秒）
+        """
+        self.workers = max(1, workers)
+        self.progress_interval = progress_interval
+        self.max_watches, self.max_instances = inotify_limits()
+        # 规划后剩余的额度，供之后新出现的一级子目录使用
+        self._watch_budget = 0
+        self._instance_budget = 0
+        self._budget_lock = threading.Lock()
+        self._event_handler = None
+        self._adopt_observer: Optional[Observer] = None
+        self._fallback = None  # 额度不足时使用的轮询 observer
+        self._adopter = ThreadPoolExecutor(max_workers=1, thread_name_prefix="StartupAdopt")
+        # 一级子树 -> (observer, watch, 占用的 watch 数)，轮询的占用为 0
+        self._children: Dict[str, Tuple[object, object, int]] = {}
+
+    # ---------------------- 统计 ----------------------
+    @staticmethod
+    def _list_subdirs(path: str) -> List[str]:
+        try:
+            with os.scandir(path) as entries:
+                return [e.path for e in entries if e.is_dir(follow_symlinks=False)]
+        except OSError:
+            return []
+
+    def count_tree(self, root: str) -> Dict[str, int]:
+        """
+        并发遍历目录树
+        :return: {一级子目录路径: 该子树的目录数（含自身）}
+        """
+        counts: Dict[str, int] = {}
+        scanned = 0
+        began = last_report = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="StartupScan") as pool:
+            # future -> 所属一级子目录
+            pending = {pool.submit(self._list_subdirs, root): None}
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    top = pending.pop(future)
+                    for child in future.result():
+                        owner = top or child
+                        counts[owner] = counts.get(owner, 0) + 1
+                        pending[pool.submit(self._list_subdirs, child)] = owner
+                    scanned += 1
+                now = time.monotonic()
+                if now - last_report >= self.progress_interval:
+                    last_report = now
+                    logger.info(f"正在统计 {root}：已遍历 {scanned} 个目录（{now - began:.0f}s）")
+        logger.info(f"统计完成 {root}：共 {scanned} 个目录，耗时 {time.monotonic() - began:.1f}s")
+        return counts
+
+    # ---------------------- 规划 ----------------------
+    def plan(self, roots: List[str], recursive: bool) -> WatchPlan:
+        """根据 inotify 额度规划每个根目录的监控方式"""
+        plan = WatchPlan()
+        if not recursive or self.max_watches is None:
+            plan.native = [(root, root, recursive) for root in roots]
+            return plan
+
+        watch_budget = int(self.max_watches * WATCH_LIMIT_USAGE)
+        instance_budget = (self.max_instances or 128) - INSTANCE_RESERVE
+        logger.info(f"inotify 上限：watch {self.max_watches}，实例 {self.max_instances}")
+
+        for index, root in enumerate(roots):
+            counts = self.count_tree(root)
+            total = 1 + sum(counts.values())
+            if total <= watch_budget and instance_budget >= 1:
+                # 后面的根目录每个至少留一个实例
+                share = instance_budget - (len(roots) - index - 1)
+                if total >= SPLIT_MIN_DIRS and len(counts) >= 2 and len(counts) + 1 <= share:
+                    # 每个一级子树单独注册，注册时并发遍历
+                    plan.split.append(root)
+                    plan.native.append((root, root, False))
+                    plan.sizes[root] = 1
+                    for child, size in counts.items():
+                        plan.native.append((root, child, True))
+                        plan.sizes[child] = size
+                    instance_budget -= len(counts) + 1
+                else:
+                    plan.native.append((root, root, True))
+                    plan.sizes[root] = total
+                    instance_budget -= 1
+                watch_budget -= total
+                continue
+
+            # 放不下整棵树：根目录非递归 + 尽量多的一级子树
+            logger.warning(f"{root} 有 {total} 个目录，超过剩余 watch 额度 {watch_budget}，部分子树改用轮询")
+            if watch_budget < 1 or instance_budget < 1:
+                plan.overflow.append(root)
+                continue
+            plan.split.append(root)
+            plan.native.append((root, root, False))
+            plan.sizes[root] = 1
+            watch_budget -= 1
+            instance_budget -= 1
+            for child, size in sorted(counts.items(), key=lambda item: item[1]):
+                if size <= watch_budget and instance_budget >= 1:
+                    plan.native.append((root, child, True))
+                    plan.sizes[child] = size
+                    watch_budget -= size
+                    instance_budget -= 1
+                else:
+                    plan.overflow.append(child)
+        self._watch_budget, self._instance_budget = watch_budget, instance_budget
+        return plan
+
+    # ---------------------- 注册 ----------------------
+    def register(self, event_handler, plan: WatchPlan, fallback=None) -> List[Observer]:
+        """
+        并发注册原生监控；注册失败（如中途超出 watch 上限）的路径加入 plan.overflow
+        :param fallback: 轮询 observer（IncrementalPollingObserver），plan.overflow 及之后超出额度的
+                         一级子目录由它递归轮询；省略时 plan.overflow 由调用方处理
+        :return: 已启动的 Observer 列表（退出时需要逐个 stop/join）
+        """
+        self._event_handler = event_handler
+        self._fallback = fallback
+        observers: List[Observer] = []
+        observers_lock = threading.Lock()
+        local = threading.local()
+
+        def schedule(root: str, path: str, recursive: bool) -> float:
+            # 每个线程使用自己的 Observer，避免 schedule 在同一把锁上串行
+            observer = getattr(local, "observer", None)
+            if observer is None:
+                observer = Observer()
+                observer.start()
+                local.observer = observer
+                with observers_lock:
+                    observers.append(observer)
+            handler = event_handler
+            if root in plan.split and path == root:
+                handler = _TopLevelHandler(self, root, event_handler)
+            began = time.monotonic()
+            watch = observer.schedule(handler, path, recursive=recursive)
+            if root in plan.split and path != root:
+                self._children[path] = (observer, watch, plan.sizes.get(path, 1))
+            return time.monotonic() - began
+
+        if plan.split:
+            self._adopt_observer = Observer()
+            self._adopt_observer.start()
+            observers.append(self._adopt_observer)
+
+        # 大的子树先注册，缩短整体耗时
+        native = sorted(plan.native, key=lambda item: plan.sizes.get(item[1], 1), reverse=True)
+        total_dirs = sum(plan.sizes.get(path, 1) for _, path, _ in native)
+        workers = min(self.workers, len(native)) or 1
+        root_times: Dict[str, float] = {}
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="StartupRegister") as pool:
+            futures = {
+                pool.submit(schedule, root, path, recursive): (root, path)
+                for root, path, recursive in native
+            }
+            began = last_report = time.monotonic()
+            done_dirs = 0
+            for done, future in enumerate(as_completed(futures), 1):
+                root, path = futures[future]
+                done_dirs += plan.sizes.get(path, 1)
+                try:
+                    elapsed = future.result()
+                    root_times[root] = root_times.get(root, 0.0) + elapsed
+                except OSError as e:
+                    logger.warning(f"注册监控失败，改用轮询: {path}（{e}）")
+                    plan.overflow.append(path)
+                now = time.monotonic()
+                if now - last_report >= self.progress_interval or done == len(futures):
+                    last_report = now
+                    logger.info(f"注册进度 {done}/{len(futures)} 个监控，{done_dirs}/{total_dirs} 个目录"
+                                f"（{now - began:.0f}s）")
+
+        for root, elapsed in root_times.items():
+            logger.info(f"根目录 {root} 注册耗时 {elapsed:.2f}s（各线程累计）")
+
+        if fallback is not None:
+            for path in plan.overflow:
+                watch = fallback.schedule(event_handler, path, recursive=True)
+                if os.path.dirname(path) in plan.split:
+                    self._children[path] = (fallback, watch, 0)
+        # 统计之后、根目录监控生效之前新建的一级子目录
+        for root in plan.split:
+            for path in self._list_subdirs(root):
+                if path not in plan.overflow:
+                    self.adopt(root, path)
+        return observers
+
+    # ---------------------- 一级子目录变化 ----------------------
+    def adopt(self, root: str, path: str) -> None:
+        """拆分的根目录下出现新的一级子目录：在后台线程中注册（不阻塞事件分发）"""
+        if os.path.dirname(path) == root:
+            self._adopter.submit(self._adopt, path)
+
+    def release(self, path: str) -> None:
+        """一级子目录被删除/移出：注销其监控并归还额度"""
+        self._adopter.submit(self._release, path)
+
+    def _adopt(self, path: str) -> None:
+        if path in self._children or not os.path.isdir(path):
+            return
+        size = sum(1 for _ in os.walk(path))
+        with self._budget_lock:
+            native = size <= self._watch_budget and self._instance_budget >= 1
+            if native:
+                self._watch_budget -= size
+                self._instance_budget -= 1
+        if native:
+            try:
+                watch = self._adopt_observer.schedule(self._event_handler, path, recursive=True)
+                self._children[path] = (self._adopt_observer, watch, size)
+                logger.info(f"新的一级子目录已加入监控: {path}（{size} 个目录）")
+                return
+            except OSError as e:
+                logger.warning(f"注册监控失败: {path}（{e}）")
+                self._return_budget(size)
+        if self._fallback is None:
+            logger.warning(f"新的一级子目录 {path} 有 {size} 个目录，超过剩余 watch 额度，未监控")
+            return
+        watch = self._fallback.schedule(self._event_handler, path, recursive=True)
+        self._children[path] = (self._fallback, watch, 0)
+        logger.info(f"新的一级子目录超过剩余 watch 额度，改用轮询: {path}（{size} 个目录）")
+
+    def _release(self, path: str) -> None:
+        entry = self._children.pop(path, None)
+        if entry is None:
+            return
+        observer, watch, size = entry
+        try:
+            observer.unschedule(watch)
+        except KeyError:
+            pass  # observer 已停止
+        if size:
+            self._return_budget(size)
+        logger.info(f"一级子目录已不存在，注销监控: {path}")
+
+    def _return_budget(self, size: int) -> None:
+        with self._budget_lock:
+            self._watch_budget += size
+            self._instance_budget += 1